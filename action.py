@@ -1,4 +1,7 @@
 import requests
+import urllib3
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
 import json
 from datetime import datetime, timedelta
 import pytz
@@ -6,6 +9,38 @@ import os
 from dotenv import load_dotenv
 import time
 import base64
+from array import array
+import hashlib
+import bisect
+import tempfile
+import gzip
+import re
+import string
+import random
+import atexit
+import threading
+import asyncio
+import sys
+import socket
+import signal
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+# brotli 为可选依赖，未安装时只生成 .gz 文件，请求时也不声明支持 br 压缩
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# orjson 为可选依赖，安装后用于更快地解析接口响应
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 加载本地的 .env 文件
 print("正在加载环境变量...")
@@ -16,282 +51,1256 @@ WXPUSHER_TOKEN = os.getenv("WXPUSHER_TOKEN")
 WXPUSHER_UIDS = [uid.strip() for uid in os.getenv("WXPUSHER_UID", "").split(",")]
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 
+def parse_location(raw):
+    """解析 "经度,纬度" 格式的地点配置"""
+    longitude, latitude = (float(v.strip()) for v in raw.split(","))
+    return longitude, latitude
+
 # 更新长春朝阳区的精确经纬度
 LONGITUDE = 125.2833  # 125°17'60" = 125.2833
 LATITUDE = 43.8336    # 43°50'1" = 43.8336
+# 页面和默认推送的地点可用 PAGE_LOCATION="经度,纬度" 改为其他地点，名称由 LOCATION_NAME 配置
+if os.getenv("PAGE_LOCATION"):
+    LONGITUDE, LATITUDE = parse_location(os.getenv("PAGE_LOCATION"))
+LOCATION_NAME = os.getenv("LOCATION_NAME", "长春市朝阳区")
 
-# 检查配置
-print("检查配置信息...")
-if not all([WXPUSHER_TOKEN, WXPUSHER_UIDS, WEATHER_API_KEY]):
-    raise ValueError("缺少必要的配置信息，请检查环境变量或.env文件")
-print(f"已配置推送目标数量: {len(WXPUSHER_UIDS)}")
+def check_config():
+    """检查必要的配置，缺失时抛出 ValueError；只在作为脚本运行时检查，便于基准测试直接导入"""
+    print("检查配置信息...")
+    if not all([WXPUSHER_TOKEN, WXPUSHER_UIDS, WEATHER_API_KEY]):
+        raise ValueError("缺少必要的配置信息，请检查环境变量或.env文件")
+    print(f"已配置推送目标数量: {len(WXPUSHER_UIDS)}")
 
-# API endpoints
-WXPUSHER_API = "http://wxpusher.zjiecode.com/api/send/message"
+# API endpoints（可通过环境变量指向本地替身服务）
+WXPUSHER_API = os.getenv("WXPUSHER_API", "http://wxpusher.zjiecode.com/api/send/message")
+CAIYUN_API_ROOT = os.getenv("CAIYUN_API_ROOT", "https://api.caiyunapp.com")
 CAIYUN_API_VERSION = "v2.6"
-WEATHER_API_BASE = f"https://api.caiyunapp.com/{CAIYUN_API_VERSION}/{WEATHER_API_KEY}/{LONGITUDE},{LATITUDE}"
-WEATHER_API_ALL = f"{WEATHER_API_BASE}/weather?alert=true&dailysteps=5&hourlysteps=24&unit=metric:v2"
+WEATHER_API_QUERY = "alert=true&dailysteps=5&hourlysteps=24&unit=metric:v2"
+
+
+def build_caiyun_url(longitude, latitude, endpoint, query):
+    """拼接彩云天气指定接口的请求地址"""
+    return f"{CAIYUN_API_ROOT}/{CAIYUN_API_VERSION}/{WEATHER_API_KEY}/{longitude},{latitude}/{endpoint}?{query}"
+
+def build_weather_api_url(longitude, latitude):
+    """拼接指定经纬度的彩云天气完整请求地址"""
+    return build_caiyun_url(longitude, latitude, "weather", WEATHER_API_QUERY)
+
+WEATHER_API_BASE = f"{CAIYUN_API_ROOT}/{CAIYUN_API_VERSION}/{WEATHER_API_KEY}/{LONGITUDE},{LATITUDE}"
+WEATHER_API_ALL = build_weather_api_url(LONGITUDE, LATITUDE)
+
+# 批量获取的并发线程数；订阅者各自的地点通过 SUBSCRIBERS_FILE 配置
+WEATHER_MAX_WORKERS = int(os.getenv("WEATHER_MAX_WORKERS", "8"))
+
+# HTTP 连接池与超时配置（秒），全进程共用一个 session
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", str(max(10, WEATHER_MAX_WORKERS))))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "30"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# 天气响应磁盘缓存：有效期、接口失败时可回退的最长时间（秒）及最多保留条数
+# 有效期为 0 时每次都请求接口，但仍写入缓存供失败时回退
+WEATHER_CACHE_DIR = os.getenv("WEATHER_CACHE_DIR", os.path.join(".cache", "weather"))
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_MAX_STALE = int(os.getenv("WEATHER_CACHE_MAX_STALE", "86400"))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "512"))
+
+# 微信推送：每批用户数、同时进行的批次数、每秒请求数上限和失败批次的重试次数
+WXPUSHER_BATCH_SIZE = int(os.getenv("WXPUSHER_BATCH_SIZE", "500"))
+WXPUSHER_MAX_CONCURRENCY = int(os.getenv("WXPUSHER_MAX_CONCURRENCY", "4"))
+WXPUSHER_RATE_LIMIT = float(os.getenv("WXPUSHER_RATE_LIMIT", "5"))
+WXPUSHER_RETRY_ATTEMPTS = int(os.getenv("WXPUSHER_RETRY_ATTEMPTS", "3"))
+
+# 推送去重：状态文件、温度（°C）和降水时长（小时）变化阈值、无变化时的处理方式
+# （suppress 不推送 / downgrade 发简短通知 / always 总是推送）以及最长多久必须推送一次（秒）
+PUSH_STATE_PATH = os.getenv("PUSH_STATE_PATH", os.path.join(".cache", "push_state.json"))
+PUSH_TEMP_THRESHOLD = float(os.getenv("PUSH_TEMP_THRESHOLD", "2"))
+PUSH_HOURS_THRESHOLD = int(os.getenv("PUSH_HOURS_THRESHOLD", "2"))
+PUSH_UNCHANGED_MODE = os.getenv("PUSH_UNCHANGED_MODE", "suppress")
+PUSH_STATE_MAX_AGE = int(os.getenv("PUSH_STATE_MAX_AGE", "86400"))
+
+# 预警监控：轮询间隔（秒）、是否只轮询一次（配合定时任务）、已推送预警的记录文件及保留时间（秒）
+ALERT_POLL_INTERVAL = int(os.getenv("ALERT_POLL_INTERVAL", "300"))
+ALERT_POLL_ONCE = os.getenv("ALERT_POLL_ONCE", "0") == "1"
+SEEN_ALERTS_PATH = os.getenv("SEEN_ALERTS_PATH", os.path.join(".cache", "seen_alerts.json"))
+SEEN_ALERTS_MAX_AGE = int(os.getenv("SEEN_ALERTS_MAX_AGE", str(7 * 86400)))
+
+# 短临降水监控：轮询间隔（秒）、是否只轮询一次、状态文件，以及开始/停止时间变化多少分钟才重新通知
+NOWCAST_POLL_INTERVAL = int(os.getenv("NOWCAST_POLL_INTERVAL", "300"))
+NOWCAST_POLL_ONCE = os.getenv("NOWCAST_POLL_ONCE", "0") == "1"
+NOWCAST_STATE_PATH = os.getenv("NOWCAST_STATE_PATH", os.path.join(".cache", "nowcast_state.json"))
+NOWCAST_TOLERANCE = int(os.getenv("NOWCAST_TOLERANCE", "15"))
+
+# 订阅者位置文件（JSON 数组，每项包含 uid、longitude、latitude，可选 name），未配置时所有推送目标使用默认经纬度
+SUBSCRIBERS_FILE = os.getenv("SUBSCRIBERS_FILE", "")
+# 经纬度吸附的网格分辨率（度），同一网格内的订阅者共用一次天气请求；彩云天气格点约 1 公里，对应 0.01 度左右
+WEATHER_GRID_RESOLUTION = float(os.getenv("WEATHER_GRID_RESOLUTION", "0.01"))
+# 订阅者未指定时使用的消息模板（short 或 detail）和语言；目前只有中文文案，其他语言回退到默认语言
+MESSAGE_TEMPLATE = os.getenv("MESSAGE_TEMPLATE", "short")
+MESSAGE_LOCALE = os.getenv("MESSAGE_LOCALE", "zh_CN")
+SUPPORTED_LOCALES = ("zh_CN",)
+
+# 运行指标：每次运行追加一行 JSON 的文件，以及可选的 Prometheus textfile 路径
+METRICS_JSONL = os.getenv("METRICS_JSONL", os.path.join(".cache", "metrics.jsonl"))
+METRICS_PROM_FILE = os.getenv("METRICS_PROM_FILE", "")
+
+# 性能分析模式：报告输出目录，以及渲染函数重复执行的次数
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profile")
+PROFILE_RENDER_LOOPS = int(os.getenv("PROFILE_RENDER_LOOPS", "50"))
+
+# 异步模式下同时进行的网络请求上限
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", str(WEATHER_MAX_WORKERS)))
+
+# 服务模式：监听地址、端口和后台刷新间隔（秒），数据超过 3 个刷新间隔未更新时健康检查报告 stale，
+# 接口失败、正在提供过期缓存数据时报告 degraded
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8080"))
+SERVE_REFRESH_INTERVAL = float(os.getenv("SERVE_REFRESH_INTERVAL", str(WEATHER_CACHE_TTL)))
+
+# 天气代码对应的中文描述，按优先级排序
+WEATHER_DESCRIPTIONS = {
+    # 降雪（优先级最高）
+    'STORM_SNOW': '暴雪',
+    'HEAVY_SNOW': '大雪',
+    'MODERATE_SNOW': '中雪',
+    'LIGHT_SNOW': '小雪',
+    # 降雨
+    'STORM_RAIN': '暴雨',
+    'HEAVY_RAIN': '大雨',
+    'MODERATE_RAIN': '中雨',
+    'LIGHT_RAIN': '小雨',
+    # 雾
+    'FOG': '雾',
+    # 沙尘
+    'SAND': '沙尘暴',
+    'DUST': '浮尘',
+    # 雾霾
+    'HEAVY_HAZE': '重度雾霾',
+    'MODERATE_HAZE': '中度雾霾',
+    'LIGHT_HAZE': '轻度雾霾',
+    # 大风
+    'WIND': '大风',
+    # 阴晴
+    'CLOUDY': '阴天',
+    'PARTLY_CLOUDY_DAY': '多云',
+    'PARTLY_CLOUDY_NIGHT': '多云',
+    'CLEAR_DAY': '晴天',
+    'CLEAR_NIGHT': '晴夜'
+}
+
+# 降水等级分界（mm/h）及对应描述，下标即降水等级
+PRECIPITATION_THRESHOLDS = (0.0606, 0.8989, 2.8700, 12.8638)
+PRECIPITATION_LEVELS = ("", "小雨", "中雨", "大雨", "暴雨")
+RAIN_ICONS = ("🌧️", "🌧️", "🌧️💧", "🌧️🌧️", "🌧️⚡")
+
+# 不降水时各天气代码的图标
+SKYCON_ICONS = {
+    'STORM_SNOW': "🌨️⚡",
+    'HEAVY_SNOW': "🌨️🌨️",
+    'MODERATE_SNOW': "🌨️❄️",
+    'LIGHT_SNOW': "🌨️",
+    'FOG': "🌫️",
+    'SAND': "⛔",
+    'DUST': "⛔",
+    'HEAVY_HAZE': "😷😷",
+    'MODERATE_HAZE': "😷",
+    'LIGHT_HAZE': "🌫️",
+    'WIND': "🌪️",
+    'CLOUDY': "☁️",
+    'PARTLY_CLOUDY_DAY': "⛅",
+    'PARTLY_CLOUDY_NIGHT': "⛅",
+    'CLEAR_DAY': "☀️",
+    'CLEAR_NIGHT': "🌙",
+}
+
+class WeatherClass(NamedTuple):
+    """某个天气代码在某个降水等级下的分类结果"""
+    description: str     # 天气代码的中文描述
+    icon: str            # 页面和简短消息使用的图标
+    table_icon: str      # 详细消息表格使用的单字符图标
+    short_weather: str   # 简短消息使用的描述（降雨时为降水等级）
+    is_rain: bool
+    is_snow: bool
+
+def _classify(skycon, level):
+    """按优先级分类：降雪 > 降雨（天气代码为雨或有降水）> 其他天气"""
+    description = WEATHER_DESCRIPTIONS.get(skycon, skycon)
+    is_snow = skycon.endswith('_SNOW')
+    is_rain = not is_snow and (skycon.endswith('_RAIN') or level > 0)
+    if is_snow:
+        return WeatherClass(description, SKYCON_ICONS[skycon], "🌨", description, False, True)
+    if is_rain:
+        return WeatherClass(description, RAIN_ICONS[level], "🌧", PRECIPITATION_LEVELS[level] or description, True, False)
+    table_icon = {'CLOUDY': "☁️", 'PARTLY_CLOUDY_DAY': "⛅", 'PARTLY_CLOUDY_NIGHT': "⛅"}.get(skycon, "☀️")
+    return WeatherClass(description, SKYCON_ICONS.get(skycon, "☁️"), table_icon, description, False, False)
+
+# 预先计算 (天气代码, 降水等级) 的全部组合，分类时只需查表
+WEATHER_CLASS_TABLE = {
+    (skycon, level): _classify(skycon, level)
+    for skycon in WEATHER_DESCRIPTIONS
+    for level in range(len(PRECIPITATION_LEVELS))
+}
+_SKYCON_BY_DESCRIPTION = {}
+for _skycon, _description in WEATHER_DESCRIPTIONS.items():
+    _SKYCON_BY_DESCRIPTION.setdefault(_description, _skycon)
+
+def get_precipitation_level(precipitation):
+    """降水量对应的降水等级下标"""
+    return bisect.bisect_right(PRECIPITATION_THRESHOLDS, precipitation)
+
+def classify_weather(skycon, precipitation=0):
+    """查表得到天气分类，未知天气代码按普通天气处理"""
+    level = get_precipitation_level(precipitation)
+    weather_class = WEATHER_CLASS_TABLE.get((skycon, level))
+    if weather_class is None:
+        weather_class = _classify(skycon, level)
+    return weather_class
+
+def classify_weather_batch(skycons, precipitations):
+    """对整段预报批量分类"""
+    table = WEATHER_CLASS_TABLE
+    levels = [bisect.bisect_right(PRECIPITATION_THRESHOLDS, p) for p in precipitations]
+    return [
+        table.get((skycon, level)) or _classify(skycon, level)
+        for skycon, level in zip(skycons, levels)
+    ]
 
 def get_weather_description(skycon):
-    """将天气代码转换为中文描述，按优先级排序"""
-    weather_map = {
-        # 降雪（优先级最高）
-        'STORM_SNOW': '暴雪',
-        'HEAVY_SNOW': '大雪',
-        'MODERATE_SNOW': '中雪',
-        'LIGHT_SNOW': '小雪',
-        # 降雨
-        'STORM_RAIN': '暴雨',
-        'HEAVY_RAIN': '大雨',
-        'MODERATE_RAIN': '中雨',
-        'LIGHT_RAIN': '小雨',
-        # 雾
-        'FOG': '雾',
-        # 沙尘
-        'SAND': '沙尘暴',
-        'DUST': '浮尘',
-        # 雾霾
-        'HEAVY_HAZE': '重度雾霾',
-        'MODERATE_HAZE': '中度雾霾',
-        'LIGHT_HAZE': '轻度雾霾',
-        # 大风
-        'WIND': '大风',
-        # 阴晴
-        'CLOUDY': '阴天',
-        'PARTLY_CLOUDY_DAY': '多云',
-        'PARTLY_CLOUDY_NIGHT': '多云',
-        'CLEAR_DAY': '晴天',
-        'CLEAR_NIGHT': '晴夜'
-    }
-    return weather_map.get(skycon, skycon)
+    """将天气代码转换为中文描述"""
+    return WEATHER_DESCRIPTIONS.get(skycon, skycon)
 
 def get_precipitation_description(precipitation):
     """根据降水量判断降水等级（使用 mm/h）"""
-    if precipitation < 0.0606:
-        return ""
-    elif precipitation < 0.8989:
-        return "小雨"
-    elif precipitation < 2.8700:
-        return "中雨"
-    elif precipitation < 12.8638:
-        return "大雨"
-    else:
-        return "暴雨"
+    return PRECIPITATION_LEVELS[get_precipitation_level(precipitation)]
 
 def get_weather_icon(weather, precipitation=0):
-    """根据天气现象和降水量返回对应的图标"""
-    # 按优先级排序
-    if "雪" in weather:
-        if "暴" in weather:
-            return "🌨️⚡"  # 暴雪
-        elif "大" in weather:
-            return "🌨️🌨️"  # 大雪
-        elif "中" in weather:
-            return "🌨️❄️"  # 中雪
-        else:
-            return "🌨️"    # 小雪
-    elif "雨" in weather or precipitation >= 0.0606:
-        if precipitation >= 12.8638:
-            return "🌧️⚡"  # 暴雨
-        elif precipitation >= 2.8700:
-            return "🌧️🌧️"  # 大雨
-        elif precipitation >= 0.8989:
-            return "🌧️💧"  # 中雨
-        else:
-            return "🌧️"    # 小雨
-    elif "雾" in weather:
-        return "🌫️"
-    elif "沙尘" in weather:
-        return "⛔"
-    elif "霾" in weather:
-        if "重" in weather:
-            return "😷😷"
-        elif "中" in weather:
-            return "😷"
+    """根据天气描述和降水量返回对应的图标"""
+    return classify_weather(_SKYCON_BY_DESCRIPTION.get(weather, weather), precipitation).icon
+
+def get_wind_direction_text(degrees):
+    """获取风向的文字描述"""
+    directions = ['北', '东北', '东', '东南', '南', '西南', '西', '西北']
+    index = round(((degrees + 22.5) % 360) / 45)
+    return directions[index % 8]
+
+class HourlyView(NamedTuple):
+    """单小时预报的预计算字段"""
+    time: str
+    temp: float
+    weather: str
+    precipitation: float
+    icon: str            # 页面和简短消息使用的图标
+    table_icon: str      # 详细消息表格使用的图标（含降水量）
+    short_weather: str   # 简短消息使用的天气描述（有降水时为降水等级）
+
+class DailyView(NamedTuple):
+    """单日预报的预计算字段"""
+    date: str
+    temp_min: float
+    temp_max: float
+    weather: str
+    icon: str
+
+class WeatherView(NamedTuple):
+    """一次获取结果对应的只读视图，所有渲染函数共用，避免重复计算"""
+    data: dict
+    current_time: str
+    wind_direction_text: str
+    today_temp_range: str
+    hourly: tuple
+    daily: tuple
+    rain_hours: int
+    snow_hours: int
+    temp_trend: tuple
+    weather_tips: tuple
+    alerts: tuple
+    stale: bool
+
+def build_weather_view(weather_data):
+    """根据天气数据一次性计算所有渲染函数需要的派生字段"""
+    current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
+    forecast = list(weather_data['forecast'])
+    
+    # 整段预报一次查表分类
+    classes = classify_weather_batch(
+        [record_skycon(f) for f in forecast],
+        [f['precipitation'] for f in forecast]
+    )
+    hourly = []
+    for f, weather_class in zip(forecast, classes):
+        table_icon = weather_class.table_icon
+        if f['precipitation'] > 0:
+            table_icon += f"({f['precipitation']}mm)"
+        hourly.append(HourlyView(
+            time=f['time'],
+            temp=f['temp'],
+            weather=weather_class.description,
+            precipitation=f['precipitation'],
+            icon=weather_class.icon,
+            table_icon=table_icon,
+            short_weather=weather_class.short_weather,
+        ))
+    
+    daily = tuple(
+        DailyView(d['date'], d['temp_min'], d['temp_max'], d['weather'], classify_weather(record_skycon(d)).icon)
+        for d in weather_data['daily_forecast']
+    )
+    today = daily[0]
+    
+    # 分析天气趋势
+    rain_hours = sum(1 for weather_class in classes[:24] if weather_class.is_rain)
+    snow_hours = sum(1 for weather_class in classes[:24] if weather_class.is_snow)
+    
+    # 温度变化趋势（每3小时与下一小时比较）
+    temp_trend = []
+    for i in range(0, len(forecast) - 1, 3):
+        current_temp = forecast[i]['temp']
+        next_temp = forecast[i + 1]['temp']
+        if next_temp - current_temp >= 3:
+            temp_trend.append("温度明显回升")
+        elif current_temp - next_temp >= 3:
+            temp_trend.append("温度明显下降")
+    
+    weather_tips = []
+    if rain_hours > 0:
+        weather_tips.append(f"未来24小时有{rain_hours}小时降雨")
+    if snow_hours > 0:
+        weather_tips.append(f"未来24小时有{snow_hours}小时降雪")
+    if weather_data['humidity'] >= 80:
+        weather_tips.append("湿度较大，注意防潮")
+    if int(weather_data['pm25']) > 75:
+        weather_tips.append("空气质量一般，建议戴口罩")
+    
+    return WeatherView(
+        data=weather_data,
+        current_time=current_time,
+        wind_direction_text=get_wind_direction_text(weather_data['wind_direction']),
+        today_temp_range=f"{today.temp_min}°C ~ {today.temp_max}°C",
+        hourly=tuple(hourly),
+        daily=daily,
+        rain_hours=rain_hours,
+        snow_hours=snow_hours,
+        temp_trend=tuple(temp_trend),
+        weather_tips=tuple(weather_tips),
+        alerts=tuple(weather_data['alerts']),
+        stale=bool(weather_data.get('stale')),
+    )
+
+def record_skycon(record):
+    """取预报条目的天气代码；只有中文描述的旧格式数据按描述反查"""
+    skycon = record.get('skycon')
+    if skycon is None:
+        skycon = _SKYCON_BY_DESCRIPTION.get(record['weather'], record['weather'])
+    return skycon
+
+def as_weather_view(weather_data):
+    """渲染函数既可以接收视图也可以接收原始天气数据"""
+    if isinstance(weather_data, WeatherView):
+        return weather_data
+    if isinstance(weather_data, WeatherSnapshot):
+        return weather_data.view
+    return build_weather_view(weather_data)
+
+def get_weather_cache_key(longitude, latitude):
+    """缓存键由经纬度、API 版本和查询参数共同决定"""
+    raw = f"{longitude},{latitude}|{CAIYUN_API_VERSION}|{WEATHER_API_QUERY}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def load_cached_payload(cache_key, max_age):
+    """读取缓存的原始响应，超过 max_age 秒或不存在时返回 None"""
+    path = os.path.join(WEATHER_CACHE_DIR, f"{cache_key}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get('fetched_at', 0) > max_age:
+        return None
+    return entry.get('payload')
+
+def save_cached_payload(cache_key, payload):
+    """写入缓存（先写临时文件再替换），并清理过旧或超出数量上限的条目"""
+    if max(WEATHER_CACHE_TTL, WEATHER_CACHE_MAX_STALE) <= 0:
+        return
+    try:
+        os.makedirs(WEATHER_CACHE_DIR, exist_ok=True)
+        path = os.path.join(WEATHER_CACHE_DIR, f"{cache_key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            # json.dumps 整体使用 C 编码器，json.dump 逐块写入会退回到纯 Python 实现
+            f.write(json.dumps({'fetched_at': time.time(), 'payload': payload}, ensure_ascii=False))
+        os.replace(tmp_path, path)
+        evict_cache_entries()
+    except OSError as e:
+        print(f"写入天气缓存失败: {str(e)}")
+
+def evict_cache_entries():
+    """删除超过最长保留时间的缓存，并按修改时间只保留最新的若干条"""
+    entries = []
+    now = time.time()
+    for name in os.listdir(WEATHER_CACHE_DIR):
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(WEATHER_CACHE_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        if now - mtime > WEATHER_CACHE_MAX_STALE:
+            os.remove(path)
         else:
-            return "🌫️"
-    elif "大风" in weather:
-        return "🌪️"
-    elif "" in weather:
-        return "☁️"
-    elif "多云" in weather:
-        return "⛅"
-    else:
-        return "☀️"
+            entries.append((mtime, path))
+    entries.sort(reverse=True)
+    for _, path in entries[WEATHER_CACHE_MAX_ENTRIES:]:
+        os.remove(path)
 
-def get_weather():
-    """获取天气信息"""
-    print("正在获取天气数据...")
+class WeatherFetchError(Exception):
+    """单个地点的天气数据获取失败"""
+
+class RetryPolicy:
+    """统一的重试策略：总时限、带随机抖动的指数退避，只对可重试的状态码重试"""
+
+    def __init__(self, max_attempts=3, deadline=45.0, base_delay=1.0, max_delay=8.0,
+                 retry_statuses=(429, 500, 502, 503, 504)):
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+
+    def start(self):
+        """返回本次请求的截止时间点"""
+        return time.monotonic() + self.deadline
+
+    def attempt_timeout(self, deadline):
+        """单次请求的 (连接超时, 读取超时)，不超过剩余时限；时限已用完时返回 None"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return (min(HTTP_CONNECT_TIMEOUT, remaining), min(HTTP_READ_TIMEOUT, remaining))
+
+    def backoff(self, attempt, deadline):
+        """第 attempt 次失败后的等待秒数（full jitter），等待后已无剩余时限时返回 None"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def is_retryable_status(self, status_code):
+        return status_code in self.retry_statuses
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却期内直接失败，冷却结束后放行一次试探请求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, name="天气接口"):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # 半开状态：放行一次，失败则重新计时
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"{self.name}连续失败 {self.failures} 次，熔断 {self.reset_timeout:.0f} 秒")
+                self.opened_at = time.monotonic()
+
+WEATHER_RETRY_POLICY = RetryPolicy(
+    max_attempts=int(os.getenv("WEATHER_RETRY_ATTEMPTS", "3")),
+    deadline=float(os.getenv("WEATHER_RETRY_DEADLINE", "45")),
+    base_delay=float(os.getenv("WEATHER_RETRY_BASE_DELAY", "1")),
+    max_delay=float(os.getenv("WEATHER_RETRY_MAX_DELAY", "8")),
+)
+PUSH_RETRY_POLICY = RetryPolicy(
+    max_attempts=WXPUSHER_RETRY_ATTEMPTS,
+    deadline=float(os.getenv("WXPUSHER_RETRY_DEADLINE", "60")),
+)
+# 预警轮询频繁，失败时很快放弃，等下一次轮询
+ALERT_RETRY_POLICY = RetryPolicy(max_attempts=2, deadline=15.0, base_delay=1.0, max_delay=2.0)
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "60"))
+
+# 每个上游主机的每个接口各用一个熔断器，预警、短临接口的故障不影响完整预报
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(api_url):
+    """返回请求地址所属 (主机, 接口) 的熔断器，不存在时创建"""
+    parts = urlsplit(api_url)
+    key = (parts.netloc, parts.path.rsplit('/', 1)[-1])
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, name=f"{key[1]} 接口")
+            _circuit_breakers[key] = breaker
+        return breaker
+
+class RunMetrics:
+    """记录一次运行中各阶段的耗时、计数和大小，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.perf_counter()
+            self.spans = []
+            self.counters = {}
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """计时一个阶段，可在 with 块内往返回的字典里补充属性"""
+        started = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.record(name, time.perf_counter() - started, **attrs)
+
+    def record(self, name, seconds, **attrs):
+        with self._lock:
+            self.spans.append({'name': name, 'seconds': round(seconds, 6), **attrs})
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self, **extra):
+        with self._lock:
+            return {
+                'run_at': datetime.fromtimestamp(self.started_at, pytz.timezone('Asia/Shanghai')).isoformat(),
+                'total_seconds': round(time.perf_counter() - self._started, 6),
+                'spans': list(self.spans),
+                'counters': dict(self.counters),
+                **extra,
+            }
+
+RUN_METRICS = RunMetrics()
+
+# 当前线程正在进行的请求的 DNS、建连耗时，由共享 session 的连接类在新建连接时写入
+_request_timing = threading.local()
+
+class _ConnectionTimingMixin:
+    """新建连接时分别记录 DNS 解析和 TCP 建连耗时，复用连接时不产生额外开销
     
-    # 设置重试次数和超时时间
-    max_retries = 3
-    timeout_seconds = 30
+    解析按 urllib3 的 IPv4/IPv6 设置过滤地址，逐个地址建连仍交给 urllib3，所有地址共用一次连接超时
+    """
+
+    def _new_conn(self):
+        host, timeout = self._dns_host, self.timeout
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(host.strip('[]'), self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, f"Failed to resolve '{host}' ({e})") from e
+        _request_timing.dns = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        deadline = started + timeout if isinstance(timeout, (int, float)) else None
+        error = None
+        try:
+            for _, _, _, _, sockaddr in addresses:
+                if deadline is not None:
+                    self.timeout = deadline - time.perf_counter()
+                    if self.timeout <= 0:
+                        break
+                self._dns_host = sockaddr[0]
+                try:
+                    sock = super()._new_conn()
+                except (ConnectTimeoutError, NewConnectionError) as e:
+                    error = e
+                    continue
+                _request_timing.connect = time.perf_counter() - started
+                return sock
+        finally:
+            self._dns_host, self.timeout = host, timeout
+        raise error or ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={timeout})")
+
+class TimedHTTPConnection(_ConnectionTimingMixin, urllib3.connection.HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_ConnectionTimingMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """连接池使用带计时的连接类，计时只作用于本程序创建的 session，不改动 urllib3 的全局函数"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def create_http_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    """创建带连接池的 session，供多个请求复用连接"""
+    session = requests.Session()
+    # 重试统一由 RetryPolicy 控制，连接池层不再叠加重试
+    adapter = TimedHTTPAdapter(
+        max_retries=0,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+    return session
+
+def get_http_session():
+    """获取进程内共享的长连接 session，天气请求和消息推送都复用它"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = create_http_session()
+                atexit.register(_http_session.close)
+    return _http_session
+
+def get_http_timeout():
+    """返回 (连接超时, 读取超时)"""
+    return (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+def get_connection_stats(session=None):
+    """统计连接池新建连接数与请求数，用于确认连接是否被复用"""
+    session = session or _http_session
+    stats = {'connections': 0, 'requests': 0, 'reused': 0}
+    if session is None:
+        return stats
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['connections'] += pool.num_connections
+            stats['requests'] += pool.num_requests
+    stats['reused'] = max(0, stats['requests'] - stats['connections'])
+    return stats
+
+class Record:
+    """使用 __slots__ 的轻量记录，同时保留按键读取的写法，兼容原来的字典用法"""
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class HourlyRecord(Record):
+    """单小时预报"""
+    __slots__ = ('hour', 'temp', 'skycon', 'precipitation')
+
+    def __init__(self, hour, temp, skycon, precipitation):
+        self.hour = hour
+        self.temp = temp
+        self.skycon = skycon
+        self.precipitation = precipitation
+
+    @property
+    def time(self):
+        return f"{self.hour:02d}:00"
+
+    @property
+    def weather(self):
+        return get_weather_description(self.skycon)
+
+    def to_dict(self):
+        return {'time': self.time, 'temp': self.temp, 'weather': self.weather, 'precipitation': self.precipitation}
+
+class HourlySeries:
+    """逐小时预报序列，数据保存在列式数组中，按下标访问时才生成 HourlyRecord"""
+    __slots__ = ('_columns',)
+
+    def __init__(self, columns):
+        self._columns = columns
+
+    def __len__(self):
+        return len(self._columns['hour'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        columns = self._columns
+        return HourlyRecord(
+            columns['hour'][index], columns['temperature'][index],
+            columns['skycon'][index], columns['precipitation'][index]
+        )
+
+    def __iter__(self):
+        columns = self._columns
+        for row in zip(columns['hour'], columns['temperature'], columns['skycon'], columns['precipitation']):
+            yield HourlyRecord(*row)
+
+class DailyRecord(Record):
+    """单日预报"""
+    __slots__ = ('date', 'temp_min', 'temp_max', 'skycon')
+
+    def __init__(self, date, temp_min, temp_max, skycon):
+        self.date = date
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.skycon = skycon
+
+    @property
+    def weather(self):
+        return get_weather_description(self.skycon)
+
+    def to_dict(self):
+        return {'date': self.date, 'temp_min': self.temp_min, 'temp_max': self.temp_max, 'weather': self.weather}
+
+class AlertRecord(Record):
+    """气象预警，只保留用到的字段"""
+    __slots__ = ('alert_id', 'title', 'description', 'code', 'pubtimestamp')
+
+    def __init__(self, alert_id, title, description, code='', pubtimestamp=0):
+        self.alert_id = alert_id
+        self.title = title
+        self.description = description
+        self.code = code
+        self.pubtimestamp = pubtimestamp
+
+    @classmethod
+    def from_api(cls, item):
+        return cls(
+            item.get('alertId', ''), item.get('title', ''), item.get('description', ''),
+            item.get('code', ''), item.get('pubtimestamp', 0)
+        )
+
+class WeatherSnapshot(Record):
+    """一个地点一次获取的天气快照，派生的视图在第一次使用时计算并缓存"""
+    __slots__ = (
+        'current_temp', 'feels_like', 'skycon', 'humidity', 'visibility', 'wind_speed',
+        'wind_direction', 'pressure', 'aqi', 'pm25', 'comfort', 'ultraviolet',
+        'hourly_columns', 'daily_forecast', 'alerts', 'stale', '_view',
+    )
+
+    def __init__(self, current_temp, feels_like, skycon, humidity, visibility, wind_speed,
+                 wind_direction, pressure, aqi, pm25, comfort, ultraviolet,
+                 hourly_columns, daily_forecast, alerts, stale=False):
+        self.current_temp = current_temp
+        self.feels_like = feels_like
+        self.skycon = skycon
+        self.humidity = humidity
+        self.visibility = visibility
+        self.wind_speed = wind_speed
+        self.wind_direction = wind_direction
+        self.pressure = pressure
+        self.aqi = aqi
+        self.pm25 = pm25
+        self.comfort = comfort
+        self.ultraviolet = ultraviolet
+        self.hourly_columns = hourly_columns
+        self.daily_forecast = daily_forecast
+        self.alerts = alerts
+        self.stale = stale
+        self._view = None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__ or key.startswith('_'):
+            raise KeyError(key)
+        setattr(self, key, value)
+        self._view = None
+
+    @property
+    def weather(self):
+        return get_weather_description(self.skycon)
+
+    @property
+    def forecast(self):
+        return HourlySeries(self.hourly_columns)
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._view = build_weather_view(self)
+        return self._view
+
+    def to_dict(self):
+        data = super().to_dict()
+        data.pop('hourly_columns')
+        data.pop('skycon')
+        data['weather'] = self.weather
+        data['forecast'] = [f.to_dict() for f in self.forecast]
+        data['daily_forecast'] = [d.to_dict() for d in self.daily_forecast]
+        data['alerts'] = [a.to_dict() for a in self.alerts]
+        return data
+
+def parse_hourly_columns(hourly):
+    """把逐小时数据一次性转换为列式数组，时间字符串只解析一次"""
+    count = min(len(hourly['temperature']), len(hourly['skycon']), len(hourly['precipitation']))
+    temperature = hourly['temperature'][:count]
+    skycon = [item['value'] for item in hourly['skycon'][:count]]
+    return {
+        # datetime 格式固定为 YYYY-MM-DDTHH:MM+08:00，小时按位置截取，无需 strptime
+        'hour': array('b', [int(item['datetime'][11:13]) for item in temperature]),
+        'temperature': array('d', [round(item['value'], 1) for item in temperature]),
+        'precipitation': array('d', [round(item['value'], 2) for item in hourly['precipitation'][:count]]),
+        'skycon': skycon,
+    }
+
+def hourly_temperature_range(columns, from_hour):
+    """小时数不小于 from_hour 的时段的 (最低, 最高) 温度，没有数据时返回 None"""
+    temps = [temp for hour, temp in zip(columns['hour'], columns['temperature']) if hour >= from_hour]
+    if not temps:
+        return None
+    return min(temps), max(temps)
+
+def parse_weather_payload(data):
+    """把彩云天气 API 的原始响应解析为 WeatherSnapshot"""
+    result = data['result']
+    realtime = result['realtime']
+    hourly = result['hourly']
+    daily = result.get('daily', {})
+    alert = result.get('alert', {})
     
-    for attempt in range(max_retries):
+    # 处理预警信息
+    alerts = [AlertRecord.from_api(item) for item in alert.get('content', [])]
+    
+    # 处理24小时预报数据
+    columns = parse_hourly_columns(hourly)
+
+    # 处理每日预报数据
+    today = datetime.now(pytz.timezone('Asia/Shanghai')).date().isoformat()
+    today_range = hourly_temperature_range(columns, datetime.now().hour)
+    daily_forecast = []
+    for temp, skycon in zip(daily['temperature'], daily['skycon']):
+        # 日期格式固定为 YYYY-MM-DDTHH:MM+08:00，直接截取
+        date = skycon['date'][:10]
+        
+        # 今天的温度区间使用小时预报中剩余时段的最低、最高温度
+        if date == today and today_range is not None:
+            min_temp, max_temp = today_range
+        else:
+            max_temp = temp['max']
+            min_temp = temp['min']
+        
+        daily_forecast.append(DailyRecord(date[5:], round(min_temp, 1), round(max_temp, 1), skycon['value']))
+    
+    return WeatherSnapshot(
+        current_temp=round(realtime['temperature'], 1),
+        feels_like=round(realtime['apparent_temperature'], 1),
+        skycon=realtime['skycon'],
+        humidity=round(realtime['humidity'] * 100),
+        visibility=round(realtime['visibility'], 1),
+        wind_speed=round(realtime['wind']['speed'] * 3.6, 1),
+        wind_direction=realtime['wind']['direction'],
+        pressure=round(realtime['pressure'] / 100, 1),
+        aqi=realtime['air_quality']['aqi'].get('chn', '未知'),
+        pm25=round(realtime['air_quality']['pm25'], 1),
+        comfort=realtime.get('life_index', {}).get('comfort', {}).get('desc', '未知'),
+        ultraviolet=realtime.get('life_index', {}).get('ultraviolet', {}).get('desc', '未知'),
+        hourly_columns=columns,
+        daily_forecast=tuple(daily_forecast),
+        alerts=tuple(alerts),
+    )
+
+def request_caiyun_payload(api_url, session=None, policy=None, breaker=None):
+    """请求彩云天气 API 并返回原始响应，重试用尽、超过总时限或熔断时抛出 WeatherFetchError"""
+    session = session or get_http_session()
+    policy = policy or WEATHER_RETRY_POLICY
+    breaker = breaker or get_circuit_breaker(api_url)
+    deadline = policy.start()
+    last_error = "未知错误"
+    
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise WeatherFetchError(f"天气接口连续失败，已熔断: {last_error}")
+        
+        timeout = policy.attempt_timeout(deadline)
+        if timeout is None:
+            break
+        retryable = True
         try:
-            print(f"第 {attempt + 1} 次尝试请求天气API: {WEATHER_API_ALL}")
-            
-            # 使用 session 来设置重试和超时
-            session = requests.Session()
-            adapter = requests.adapters.HTTPAdapter(
-                max_retries=3,
-                pool_connections=100,
-                pool_maxsize=100
-            )
-            session.mount('http://', adapter)
-            session.mount('https://', adapter)
+            print(f"第 {attempt + 1} 次尝试请求天气API: {api_url}")
+            if attempt > 0:
+                RUN_METRICS.incr('fetch_retries')
             
-            response = session.get(
-                WEATHER_API_ALL,
-                timeout=(timeout_seconds, timeout_seconds)  # (连接超时, 读取超时)
+            # 复用连接时不会新建连接，DNS 和建连耗时记为 0
+            _request_timing.dns = 0.0
+            _request_timing.connect = 0.0
+            started = time.perf_counter()
+            response = session.get(api_url, timeout=timeout, stream=True)
+            ttfb = time.perf_counter() - started
+            body_started = time.perf_counter()
+            content = response.content
+            RUN_METRICS.record(
+                'fetch.request', time.perf_counter() - started,
+                endpoint=api_url.split('?')[0].rsplit('/', 1)[-1],
+                status=response.status_code,
+                dns=round(_request_timing.dns, 6),
+                connect=round(_request_timing.connect, 6),
+                ttfb=round(ttfb - _request_timing.dns - _request_timing.connect, 6),
+                body=round(time.perf_counter() - body_started, 6),
+                bytes=len(content),
             )
+            RUN_METRICS.incr('payload_bytes', len(content))
             
             print(f"天气API状态码: {response.status_code}")
             
             if response.status_code == 200:
-                data = response.json()
+                data = json_loads(content)
                 if data['status'] == 'ok':
-                    result = data['result']
-                    realtime = result['realtime']
-                    hourly = result['hourly']
-                    daily = result.get('daily', {})
-                    alert = result.get('alert', {})
-                    
-                    # 处理预警信息
-                    alerts = []
-                    if 'content' in alert:
-                        alerts = alert.get('content', [])
-                    
-                    # 处理24小时预报数据
-                    forecast_list = []
-                    for temp, skycon, precip in zip(hourly['temperature'], hourly['skycon'], hourly['precipitation']):
-                        time_str = temp['datetime']
-                        forecast_time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M%z")
-                        weather_desc = get_weather_description(skycon['value'])
-                        
-                        forecast_list.append({
-                            'time': forecast_time.strftime("%H:00"),
-                            'temp': round(temp['value'], 1),
-                            'weather': weather_desc,
-                            'precipitation': round(precip['value'], 2)
-                        })
-
-                    # 处理每日预报数据
-                    daily_forecast = []
-                    for temp, skycon in zip(daily['temperature'], daily['skycon']):
-                        # 确保日期格式正确
-                        date = datetime.strptime(skycon['date'].split('T')[0], "%Y-%m-%d")
-                        
-                        # 今天的温度区间应该使用实时温度和小时预报的最高温度
-                        if date.date() == datetime.now(pytz.timezone('Asia/Shanghai')).date():
-                            # 获取今天的最高温度（从小时预报中）
-                            today_temps = [f['temp'] for f in forecast_list if datetime.strptime(f['time'], "%H:00").hour >= datetime.now().hour]
-                            if today_temps:
-                                max_temp = max(today_temps)
-                                min_temp = min(today_temps)
-                            else:
-                                max_temp = temp['max']
-                                min_temp = temp['min']
-                        else:
-                            max_temp = temp['max']
-                            min_temp = temp['min']
-                        
-                        daily_forecast.append({
-                            'date': date.strftime("%m-%d"),
-                            'temp_min': round(min_temp, 1),
-                            'temp_max': round(max_temp, 1),
-                            'weather': get_weather_description(skycon['value'])
-                        })
-                    
-                    return {
-                        'current_temp': round(realtime['temperature'], 1),
-                        'feels_like': round(realtime['apparent_temperature'], 1),
-                        'weather': get_weather_description(realtime['skycon']),
-                        'humidity': round(realtime['humidity'] * 100),
-                        'visibility': round(realtime['visibility'], 1),
-                        'wind_speed': round(realtime['wind']['speed'] * 3.6, 1),
-                        'wind_direction': realtime['wind']['direction'],
-                        'pressure': round(realtime['pressure'] / 100, 1),
-                        'aqi': realtime['air_quality']['aqi'].get('chn', '未知'),
-                        'pm25': round(realtime['air_quality']['pm25'], 1),
-                        'forecast': forecast_list,
-                        'alerts': alerts,
-                        'comfort': realtime.get('life_index', {}).get('comfort', {}).get('desc', '未知'),
-                        'ultraviolet': realtime.get('life_index', {}).get('ultraviolet', {}).get('desc', '未知'),
-                        'daily_forecast': daily_forecast,
-                    }
+                    breaker.record_success()
+                    return data
                 else:
-                    print(f"API返回状态错误: {data.get('status')}")
+                    # 接口明确返回错误（如密钥无效），重试也不会成功
+                    last_error = f"API返回状态错误: {data.get('status')}"
+                    retryable = False
+                    print(last_error)
             else:
-                print(f"请求失败，HTTP状态码: {response.status_code}")
+                last_error = f"请求失败，HTTP状态码: {response.status_code}"
+                retryable = policy.is_retryable_status(response.status_code)
+                print(last_error)
                 
         except requests.exceptions.Timeout:
-            print(f"第 {attempt + 1} 次请求超时")
+            last_error = f"第 {attempt + 1} 次请求超时"
+            print(last_error)
         except requests.exceptions.RequestException as e:
-            print(f"第 {attempt + 1} 次请求发生错误: {str(e)}")
+            last_error = f"第 {attempt + 1} 次请求发生错误: {str(e)}"
+            print(last_error)
         except Exception as e:
-            print(f"第 {attempt + 1} 次请求发生未知错误: {str(e)}")
+            last_error = f"第 {attempt + 1} 次请求发生未知错误: {str(e)}"
+            print(last_error)
             import traceback
             print(f"错误堆栈: {traceback.format_exc()}")
         
-        if attempt < max_retries - 1:
-            wait_time = (attempt + 1) * 5  # 递增等待时间
-            print(f"等待 {wait_time} 秒后重试...")
+        if not retryable:
+            # 参数错误、密钥无效等是请求本身的问题，不代表上游故障，不计入熔断
+            raise WeatherFetchError(f"请求失败 ({api_url}): {last_error}")
+        
+        if attempt < policy.max_attempts - 1:
+            wait_time = policy.backoff(attempt, deadline)
+            if wait_time is None:
+                print("重试总时限已用完")
+                break
+            print(f"等待 {wait_time:.1f} 秒后重试...")
             time.sleep(wait_time)
     
-    print("所有重试都失败了")
-    return None
+    # 一次获取无论重试几次，失败只计一次
+    breaker.record_failure()
+    raise WeatherFetchError(f"所有重试都失败了 ({api_url}): {last_error}")
+
+def parse_alerts_payload(data):
+    """只提取预警列表"""
+    return [AlertRecord.from_api(item) for item in data['result'].get('alert', {}).get('content', [])]
+
+def parse_nowcast_payload(data):
+    """只提取逐分钟降水，返回 (服务器时间, 未来两小时逐分钟降水强度, 文字描述)"""
+    minutely = data['result']['minutely']
+    return data.get('server_time', time.time()), minutely['precipitation_2h'], minutely.get('description', '')
+
+class FetchProfile(NamedTuple):
+    """一种请求方式：请求的接口、最少的查询参数和只提取所需字段的解析函数"""
+    endpoint: str
+    query: str
+    parser: object
+    policy: object = None
+
+# 不同触发场景只请求自己用到的数据。页面和推送消息都展示五天预报并统计24小时降水，
+# 共用 full；预警监控和短临降水监控只请求各自的小接口
+FETCH_PROFILES = {
+    'full': FetchProfile("weather", WEATHER_API_QUERY, parse_weather_payload),
+    'alert': FetchProfile("realtime", "alert=true&unit=metric:v2", parse_alerts_payload, ALERT_RETRY_POLICY),
+    'nowcast': FetchProfile("minutely", "unit=metric:v2", parse_nowcast_payload, ALERT_RETRY_POLICY),
+}
+
+def request_profile_payload(name, longitude=LONGITUDE, latitude=LATITUDE, session=None):
+    """按指定请求方式请求接口，返回未解析的原始响应"""
+    profile = FETCH_PROFILES[name]
+    return request_caiyun_payload(
+        build_caiyun_url(longitude, latitude, profile.endpoint, profile.query), session, profile.policy
+    )
+
+def fetch_profile(name, longitude=LONGITUDE, latitude=LATITUDE, session=None):
+    """按指定请求方式获取并解析数据，失败时抛出 WeatherFetchError"""
+    data = request_profile_payload(name, longitude, latitude, session)
+    try:
+        return FETCH_PROFILES[name].parser(data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise WeatherFetchError(f"{name} 数据解析失败: {str(e)}")
+
+def fetch_weather(longitude=LONGITUDE, latitude=LATITUDE, session=None, max_age=None):
+    """获取单个地点的天气信息，优先使用不超过 max_age 秒（默认 WEATHER_CACHE_TTL）的缓存，请求失败时回退到旧缓存"""
+    print(f"正在获取天气数据 ({longitude},{latitude})...")
+    cache_key = get_weather_cache_key(longitude, latitude)
+    
+    max_age = WEATHER_CACHE_TTL if max_age is None else max_age
+    cached = load_cached_payload(cache_key, max_age) if max_age > 0 else None
+    if cached is not None:
+        print(f"使用缓存的天气数据 ({longitude},{latitude})")
+        RUN_METRICS.incr('cache_hits')
+        with RUN_METRICS.span('parse'):
+            return parse_weather_payload(cached)
+    
+    try:
+        data = request_profile_payload('full', longitude, latitude, session)
+        try:
+            with RUN_METRICS.span('parse'):
+                weather_data = FETCH_PROFILES['full'].parser(data)
+        except (KeyError, TypeError, ValueError) as e:
+            raise WeatherFetchError(f"天气数据解析失败 ({longitude},{latitude}): {str(e)}")
+    except WeatherFetchError:
+        # 接口不可用或返回的数据无法解析时使用最近一次成功的数据，并标记为过期
+        stale = load_cached_payload(cache_key, WEATHER_CACHE_MAX_STALE)
+        if stale is None:
+            raise
+        print(f"天气数据获取失败，使用过期缓存数据 ({longitude},{latitude})")
+        weather_data = parse_weather_payload(stale)
+        weather_data['stale'] = True
+        return weather_data
+    
+    # 只缓存能正常解析的响应
+    save_cached_payload(cache_key, data)
+    return weather_data
+
+def get_weather(longitude=LONGITUDE, latitude=LATITUDE, session=None, max_age=None):
+    """获取天气信息"""
+    try:
+        return fetch_weather(longitude, latitude, session, max_age)
+    except WeatherFetchError as e:
+        print(str(e))
+        return None
+
+def get_weather_batch(locations, max_workers=None):
+    """并发获取多个地点的天气信息，返回 (结果, 错误) 两个以经纬度为键的字典"""
+    max_workers = max(1, min(max_workers or WEATHER_MAX_WORKERS, len(locations)))
+    print(f"正在并发获取 {len(locations)} 个地点的天气数据，并发数: {max_workers}")
+    
+    # 所有线程共用进程级 session，并发数超过连接池上限时多出的连接不会被保留
+    if max_workers > HTTP_POOL_MAXSIZE:
+        print(f"警告：并发数 {max_workers} 大于连接池上限 {HTTP_POOL_MAXSIZE}，请调大 HTTP_POOL_MAXSIZE")
+    session = get_http_session()
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_weather, longitude, latitude, session): (longitude, latitude)
+            for longitude, latitude in locations
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            try:
+                results[location] = future.result()
+            except Exception as e:
+                errors[location] = str(e)
+    
+    print(f"批量获取完成: 成功 {len(results)} 个，失败 {len(errors)} 个")
+    return results, errors
+
+async def get_weather_batch_async(locations, concurrency=None):
+    """异步并发获取多个地点的天气信息，返回 (结果, 错误) 两个以经纬度为键的字典"""
+    semaphore = asyncio.Semaphore(concurrency or ASYNC_CONCURRENCY)
+
+    async def fetch_one(longitude, latitude):
+        async with semaphore:
+            return await asyncio.to_thread(fetch_weather, longitude, latitude)
+
+    outcomes = await asyncio.gather(
+        *(fetch_one(longitude, latitude) for longitude, latitude in locations),
+        return_exceptions=True
+    )
+    results = {}
+    errors = {}
+    for location, outcome in zip(locations, outcomes):
+        if isinstance(outcome, Exception):
+            errors[location] = str(outcome)
+        else:
+            results[location] = outcome
+    print(f"批量获取完成: 成功 {len(results)} 个，失败 {len(errors)} 个")
+    return results, errors
+
+def snap_to_grid(longitude, latitude, resolution=None):
+    """把经纬度吸附到最近的网格点，分辨率不大于 0 时原样返回"""
+    resolution = WEATHER_GRID_RESOLUTION if resolution is None else resolution
+    if resolution <= 0:
+        return (longitude, latitude)
+    # 再次取整去掉浮点误差，保证同一网格得到完全相同的键和请求地址
+    return (round(round(longitude / resolution) * resolution, 6), round(round(latitude / resolution) * resolution, 6))
+
+class LocationIndex:
+    """按网格单元归并订阅者，每个单元只需要请求一次天气；单元内再按 (模板, 语言) 分组"""
+    __slots__ = ('resolution', '_cells', '_names', '_uid_cells')
+
+    def __init__(self, resolution=None):
+        self.resolution = WEATHER_GRID_RESOLUTION if resolution is None else resolution
+        self._cells = {}
+        self._names = {}
+        self._uid_cells = {}
+
+    def add(self, uid, longitude, latitude, name="", template=None, locale=None):
+        """登记订阅者的位置和消息偏好，返回所在的网格单元；同一订阅者重复登记时以最后一次为准"""
+        cell = snap_to_grid(longitude, latitude, self.resolution)
+        previous = self._uid_cells.get(uid)
+        if previous is not None:
+            del self._cells[previous][uid]
+            if not self._cells[previous]:
+                del self._cells[previous]
+        self._uid_cells[uid] = cell
+        # 用 dict 保存成员及其 (模板, 语言)，既去重又保留登记顺序
+        self._cells.setdefault(cell, {})[uid] = (template or MESSAGE_TEMPLATE, locale or MESSAGE_LOCALE)
+        if name and not self._names.get(cell):
+            self._names[cell] = name
+        return cell
+
+    def cells(self):
+        return list(self._cells)
+
+    def subscribers(self, cell):
+        return list(self._cells.get(cell, ()))
+
+    def groups(self, cell):
+        """返回 {(模板, 语言): [uid]}，同组订阅者收到完全相同的消息"""
+        groups = {}
+        for uid, key in self._cells.get(cell, {}).items():
+            groups.setdefault(key, []).append(uid)
+        return groups
+
+    def name(self, cell):
+        return self._names.get(cell) or f"{cell[1]:.2f}°N, {cell[0]:.2f}°E"
+
+    def __len__(self):
+        return len(self._uid_cells)
+
+def load_subscribers(path=None):
+    """读取订阅者位置列表；未配置文件时所有推送目标使用默认经纬度，文件无法读取时返回空列表"""
+    path = SUBSCRIBERS_FILE if path is None else path
+    if not path:
+        return [
+            {'uid': uid, 'longitude': LONGITUDE, 'latitude': LATITUDE, 'name': LOCATION_NAME}
+            for uid in WXPUSHER_UIDS if uid
+        ]
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取订阅者文件失败: {str(e)}")
+        return []
+    
+    subscribers = []
+    unknown_templates = set()
+    fallback_locales = set()
+    for entry in entries:
+        try:
+            subscriber = {
+                'uid': str(entry['uid']),
+                'longitude': float(entry['longitude']),
+                'latitude': float(entry['latitude']),
+                'name': entry.get('name', ''),
+                'template': entry.get('template') or MESSAGE_TEMPLATE,
+                'locale': entry.get('locale') or MESSAGE_LOCALE,
+            }
+        except (KeyError, TypeError, ValueError, AttributeError):
+            print(f"忽略无效的订阅者配置: {entry}")
+            continue
+        if subscriber['template'] not in MESSAGE_TEMPLATES:
+            unknown_templates.add(subscriber['template'])
+            subscriber['template'] = MESSAGE_TEMPLATE
+        # 不支持的语言归到默认语言，避免产生内容相同的分组
+        if subscriber['locale'] not in SUPPORTED_LOCALES:
+            fallback_locales.add(subscriber['locale'])
+            subscriber['locale'] = MESSAGE_LOCALE
+        subscribers.append(subscriber)
+    if unknown_templates:
+        print(f"不存在的模板 {', '.join(sorted(map(str, unknown_templates)))}，已改用 {MESSAGE_TEMPLATE}")
+    if fallback_locales:
+        print(f"暂不支持的语言 {', '.join(sorted(map(str, fallback_locales)))}，已回退到 {MESSAGE_LOCALE}")
+    return subscribers
+
+def build_location_index(subscribers, resolution=None):
+    """把订阅者列表按网格归并为 LocationIndex"""
+    index = LocationIndex(resolution)
+    for subscriber in subscribers:
+        index.add(
+            subscriber['uid'], subscriber['longitude'], subscriber['latitude'],
+            subscriber.get('name', ''), subscriber.get('template'), subscriber.get('locale')
+        )
+    return index
 
-def format_weather_message(weather_data):
+def format_weather_message(weather_data, location_name=None):
     """式化天气消息"""
     if not weather_data:
         return "获取天气信息失败"
     
-    current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
-    
-    # 获取风向的文字描述
-    def get_wind_direction_text(degrees):
-        directions = ['北', '东北', '东', '东南', '南', '西南', '西', '西北']
-        index = round(((degrees + 22.5) % 360) / 45)
-        return directions[index % 8]
-    
-    wind_direction_text = get_wind_direction_text(weather_data['wind_direction'])
+    view = as_weather_view(weather_data)
+    data = view.data
     
     # 构建时天气信息
-    message = f"""🌈 长春市朝阳区天气预报
+    message = f"""🌈 {location_name or LOCATION_NAME}天气预报
 ━━━━━━━━━
-📅 更新时间：{current_time}
+📅 更新时间：{view.current_time}
 
 🌡️ 实时天气
-• 当前温度：{weather_data['current_temp']}°C
-• 体感温度：{weather_data['feels_like']}°C
-• 天气状况：{weather_data['weather']}
+• 当前温度：{data['current_temp']}°C
+• 体感温度：{data['feels_like']}°C
+• 天气状况：{data['weather']}
 
 💨 环境指数
-• 相对湿度：{weather_data['humidity']}%
-• 气压：{weather_data['pressure']}hPa
-• 见度：{weather_data['visibility']}km
+• 相对湿度：{data['humidity']}%
+• 气压：{data['pressure']}hPa
+• 见度：{data['visibility']}km
 
 🌪️ 风力状况
-• 风向：{wind_direction_text}风 ({weather_data['wind_direction']}°)
-• 风速：{weather_data['wind_speed']}km/h
+• 风向：{view.wind_direction_text}风 ({data['wind_direction']}°)
+• 风速：{data['wind_speed']}km/h
 
 🌫️ 空气质量
-• AQI指数：{weather_data['aqi']}
-• PM2.5：{weather_data['pm25']}μg/m³
+• AQI指数：{data['aqi']}
+• PM2.5：{data['pm25']}μg/m³
 
 👨‍👩‍👦 生活指数
-• 舒适度：{weather_data['comfort']}
-• 紫外线：{weather_data['ultraviolet']}"""
+• 舒适度：{data['comfort']}
+• 紫外线：{data['ultraviolet']}"""
 
     # 添加预警信息（如果有）
-    if weather_data['alerts']:
+    if view.alerts:
         message += "\n\n⚠️ 预警信息"
         message += "\n━━━━━━━━━━━━"
-        for alert in weather_data['alerts']:
+        for alert in view.alerts:
             message += f"\n{alert['title']}\n{alert['description']}"
 
-    # 添加24小时预报，使用表格样式���示
+    # 添加24小时预报，使用表格样式显示
     message += "\n\n⏰ 未来24小时预报"
     message += "\n━━━━━━━━━━"
     
@@ -301,32 +1310,15 @@ def format_weather_message(weather_data):
     weather_line = "\n天气  "
     
     # 每3小时显示一次，共显示8个时间点
-    for i, forecast in enumerate(weather_data['forecast']):
-        if i % 3 == 0 and i < 24:
-            # 对齐处理
-            time = forecast['time'].rjust(5)
-            temp = f"{forecast['temp']}°C".rjust(5)
-            
-            # 选择天气图标
-            if "雨" in forecast['weather']:
-                weather_icon = "🌧"
-            elif "雪" in forecast['weather']:
-                weather_icon = "🌨"
-            elif "阴" in forecast['weather']:
-                weather_icon = "☁️"
-            elif "多云" in forecast['weather']:
-                weather_icon = "⛅"
-            else:
-                weather_icon = "☀️"
-            
-            # 添加降水量信息
-            if forecast['precipitation'] > 0:
-                weather_icon += f"({forecast['precipitation']}mm)"
-            
-            # 构建时间轴
-            time_header += f"{time} "
-            temp_line += f"{temp} "
-            weather_line += f" {weather_icon}  "
+    for forecast in view.hourly[:24:3]:
+        # 对齐处理
+        time = forecast.time.rjust(5)
+        temp = f"{forecast.temp}°C".rjust(5)
+        
+        # 构建时间轴
+        time_header += f"{time} "
+        temp_line += f"{temp} "
+        weather_line += f" {forecast.table_icon}  "
     
     message += time_header
     message += "\n────────────────────────────────"
@@ -335,18 +1327,8 @@ def format_weather_message(weather_data):
     message += weather_line
 
     # 添加温度变化趋势提示
-    temp_trend = []
-    for i in range(len(weather_data['forecast'])-1):
-        if i % 3 == 0:
-            current_temp = weather_data['forecast'][i]['temp']
-            next_temp = weather_data['forecast'][i+1]['temp']
-            if next_temp - current_temp >= 3:
-                temp_trend.append("温度明显回升")
-            elif current_temp - next_temp >= 3:
-                temp_trend.append("温度明显下降")
-    
-    if temp_trend:
-        message += f"\n\n📈 温度趋势：{'，'.join(temp_trend)}"
+    if view.temp_trend:
+        message += f"\n\n📈 温度趋势：{'，'.join(view.temp_trend)}"
 
     # 添加数据来源说明
     message += "\n\n━━━━━━━━━━"
@@ -354,382 +1336,860 @@ def format_weather_message(weather_data):
 
     return message
 
-def push_to_wxpusher(message):
-    """推送消息到微信"""
-    print("准备推送消息...")
+class RateLimiter:
+    """限制每秒发出的请求数，多个线程共用"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+# 所有推送共用一个限速器，分网格、分组以及预警、短临提醒的推送合起来受 WXPUSHER_RATE_LIMIT 限制
+WXPUSHER_RATE_LIMITER = RateLimiter(WXPUSHER_RATE_LIMIT)
+
+def chunk_uids(uids, batch_size):
+    """把推送目标按批次大小切分"""
+    return [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+
+def send_wxpusher_batch(message, uids, summary="天气预报详情", limiter=None):
+    """发送一批推送，返回包含是否成功、是否可重试、耗时和送达人数的结果"""
     data = {
         "appToken": WXPUSHER_TOKEN,
         "content": message,
         "contentType": 3,  # 3表示Markdown格式，支持超链接
-        "uids": WXPUSHER_UIDS,
-        "summary": "天气预报详情"
+        "uids": uids,
+        "summary": summary
     }
+    if limiter is not None:
+        limiter.acquire()
     
+    started = time.monotonic()
+    outcome = {'uids': len(uids), 'ok': False, 'retryable': True, 'delivered': 0, 'error': ''}
     try:
-        print(f"推送消息内容: {message}")
-        response = requests.post(WXPUSHER_API, json=data)
-        result = response.json()
-        print(f"推送响应: {json.dumps(result, ensure_ascii=False, indent=2)}")
-        
-        if result['code'] == 1000:
-            print(f"消息成功推送给 {len(WXPUSHER_UIDS)} 个用户")
-            return True
+        response = get_http_session().post(WXPUSHER_API, json=data, timeout=get_http_timeout())
+        if response.status_code != 200:
+            outcome['error'] = f"HTTP状态码: {response.status_code}"
+            outcome['retryable'] = PUSH_RETRY_POLICY.is_retryable_status(response.status_code)
         else:
-            print(f"消息推送失败: {result['msg']}")
-            return False
+            result = response.json()
+            if result['code'] == 1000:
+                # data 中是每个用户的发送结果，缺失时按整批送达计算
+                details = result.get('data') or []
+                outcome['delivered'] = sum(1 for d in details if d.get('code') == 1000) if details else len(uids)
+                outcome['ok'] = True
+            else:
+                outcome['error'] = result.get('msg', '未知错误')
+                outcome['retryable'] = False
+    except requests.exceptions.ReadTimeout as e:
+        # 请求已经发出，服务端可能已经受理，重试会导致重复推送
+        outcome['error'] = f"读取响应超时，可能已送达: {str(e)}"
+        outcome['retryable'] = False
     except Exception as e:
-        print(f"推送消息时发生错误: {str(e)}")
+        outcome['error'] = str(e)
+    outcome['latency'] = time.monotonic() - started
+    return outcome
+
+def dispatch_wxpusher(message, uids, summary="天气预报详情"):
+    """分批并发推送，受速率限制，只重试失败的批次，返回每批的结果"""
+    batches = chunk_uids(uids, WXPUSHER_BATCH_SIZE)
+    limiter = WXPUSHER_RATE_LIMITER
+    deadline = PUSH_RETRY_POLICY.start()
+    reports = [None] * len(batches)
+    pending = list(range(len(batches)))
+    
+    for attempt in range(PUSH_RETRY_POLICY.max_attempts):
+        workers = max(1, min(WXPUSHER_MAX_CONCURRENCY, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(executor.map(
+                lambda index: send_wxpusher_batch(message, batches[index], summary, limiter), pending
+            ))
+        
+        retry = []
+        for index, outcome in zip(pending, outcomes):
+            outcome['batch'] = index + 1
+            outcome['attempts'] = attempt + 1
+            reports[index] = outcome
+            RUN_METRICS.record(
+                'push.batch', outcome['latency'], batch=index + 1, attempt=attempt + 1,
+                uids=outcome['uids'], delivered=outcome['delivered'], ok=outcome['ok']
+            )
+            status = "成功" if outcome['ok'] else f"失败: {outcome['error']}"
+            print(f"第 {index + 1}/{len(batches)} 批（{outcome['uids']} 人）{status}，"
+                  f"耗时 {outcome['latency']:.2f} 秒，送达 {outcome['delivered']} 人")
+            if not outcome['ok'] and outcome['retryable']:
+                retry.append(index)
+        
+        pending = retry
+        if pending:
+            RUN_METRICS.incr('push_retries', len(pending))
+        if not pending or attempt == PUSH_RETRY_POLICY.max_attempts - 1:
+            break
+        wait_time = PUSH_RETRY_POLICY.backoff(attempt, deadline)
+        if wait_time is None:
+            print("推送重试总时限已用完")
+            break
+        print(f"{len(pending)} 个批次推送失败，等待 {wait_time:.1f} 秒后重试...")
+        time.sleep(wait_time)
+    
+    return reports
+
+def push_to_wxpusher(message, uids=None):
+    """推送消息到微信"""
+    uids = [uid for uid in (uids if uids is not None else WXPUSHER_UIDS) if uid]
+    print("准备推送消息...")
+    print(f"推送消息内容: {message}")
+    if not uids:
+        print("没有推送目标")
         return False
+    
+    reports = dispatch_wxpusher(message, uids)
+    delivered = sum(r['delivered'] for r in reports)
+    failed = sum(r['uids'] for r in reports if not r['ok'])
+    if failed == 0:
+        print(f"消息成功推送给 {delivered} 个用户（共 {len(reports)} 批）")
+        return True
+    print(f"消息推送部分失败: 送达 {delivered} 个用户，{failed} 个用户推送失败")
+    return False
 
-def generate_html_content(weather_data):
-    """生成HTML格式的天气信息"""
-    current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
+def load_json_state(path):
+    """读取 JSON 状态文件，不存在或损坏时返回空字典"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_json_state(path, state):
+    """原子写入 JSON 状态文件"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    write_file_atomic(path, json.dumps(state, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+def build_push_digest(weather_data):
+    """提取推送内容中的关键字段，用于判断与上次推送相比是否有实质变化"""
+    view = as_weather_view(weather_data)
+    today = view.daily[0]
+    return {
+        'temp_min': today.temp_min,
+        'temp_max': today.temp_max,
+        'conditions': [forecast.short_weather for forecast in view.hourly[:6]],
+        'rain_hours': view.rain_hours,
+        'snow_hours': view.snow_hours,
+        'alerts': sorted(alert['title'] for alert in view.alerts),
+    }
+
+def describe_push_changes(previous, current):
+    """列出两次摘要之间超过阈值的变化，没有实质变化时返回空列表"""
+    changes = []
+    if sorted(set(current['alerts']) - set(previous.get('alerts', []))):
+        changes.append("有新的预警")
+    for key, label in (('temp_min', '最低温度'), ('temp_max', '最高温度')):
+        if abs(current[key] - previous.get(key, current[key])) >= PUSH_TEMP_THRESHOLD:
+            changes.append(f"{label}变化")
+    for key, label in (('rain_hours', '降雨时长'), ('snow_hours', '降雪时长')):
+        before = previous.get(key, 0)
+        # 从无到有或从有到无总算变化
+        if abs(current[key] - before) >= PUSH_HOURS_THRESHOLD or (current[key] == 0) != (before == 0):
+            changes.append(f"{label}变化")
+    if current['conditions'] != previous.get('conditions'):
+        changes.append("未来6小时天气变化")
+    return changes
+
+def decide_push(weather_data, trigger_event="", state_path=None):
+    """根据上次推送的摘要决定本次是 push（正常推送）、downgrade（简短通知）还是 skip（不推送）"""
+    digest = build_push_digest(weather_data)
+    if PUSH_UNCHANGED_MODE == "always" or trigger_event == "workflow_dispatch":
+        return "push", digest
+    
+    state = load_json_state(state_path or PUSH_STATE_PATH)
+    previous = state.get('digest')
+    if not previous or time.time() - state.get('pushed_at', 0) > PUSH_STATE_MAX_AGE:
+        return "push", digest
+    
+    changes = describe_push_changes(previous, digest)
+    if changes:
+        print(f"天气有变化: {'，'.join(changes)}")
+        return "push", digest
+    print("与上次推送相比天气无明显变化")
+    return ("downgrade" if PUSH_UNCHANGED_MODE == "downgrade" else "skip"), digest
+
+def generate_unchanged_message(weather_data):
+    """天气无明显变化时发送的简短通知"""
+    view = as_weather_view(weather_data)
+    return (
+        f"🌈 天气无明显变化（{view.current_time}）\n"
+        f"• 当前 {view.data['current_temp']}°C {view.data['weather']}，今日 {view.today_temp_range}\n\n"
+        f"📱 [点击查看详细天气预报](https://207279525.github.io/weather-report/)"
+    )
+
+def render_message(template, locale, weather_data, location_name=None):
+    """按模板渲染推送消息；locale 目前只有中文，预留给以后的多语言文案"""
+    RUN_METRICS.incr('message_renders')
+    if template not in MESSAGE_TEMPLATES:
+        template = 'short'
+    with RUN_METRICS.span(f'render.{template}'):
+        return MESSAGE_TEMPLATES[template](weather_data, location_name)
+
+def push_groups_update(weather_data, groups, trigger_event="", location_name=None, state_path=None):
+    """同一份天气数据按 {(模板, 语言): uids} 分组推送，每组只渲染一次；推送成功后记录本次摘要，跳过推送也视为成功"""
+    decision, digest = decide_push(weather_data, trigger_event, state_path)
+    if decision == "skip":
+        print("跳过本次推送")
+        return True
+    
+    success = True
+    rendered = {}
+    for (template, locale), uids in groups.items():
+        # 简短通知不区分模板，整个单元只渲染一次
+        key = "unchanged" if decision == "downgrade" else (template, locale)
+        if key not in rendered:
+            if decision == "downgrade":
+                rendered[key] = generate_unchanged_message(weather_data)
+            else:
+                rendered[key] = render_message(template, locale, weather_data, location_name)
+        success = push_to_wxpusher(rendered[key], uids) and success
+    if success and decision == "push":
+        save_json_state(state_path or PUSH_STATE_PATH, {'digest': digest, 'pushed_at': time.time()})
+        # 完整推送中已包含预警标题，预警监控不再重复推送这些预警
+        mark_alerts_seen(as_weather_view(weather_data).alerts)
+    return success
+
+def push_weather_update(weather_data, trigger_event="", uids=None, location_name=None, state_path=None):
+    """按变化情况把默认模板的消息推送给 uids（默认为全部推送目标）"""
+    groups = {(MESSAGE_TEMPLATE, MESSAGE_LOCALE): uids}
+    return push_groups_update(weather_data, groups, trigger_event, location_name, state_path)
+
+def cell_state_path(cell):
+    """每个网格单元单独记录上次推送的摘要"""
+    return os.path.join(os.path.dirname(PUSH_STATE_PATH) or '.', "push_state", f"{cell[0]},{cell[1]}.json")
+
+def push_subscribers_update(index, trigger_event="", prefetched=None, failed=None):
+    """每个网格单元只请求一次天气，单元内每个 (模板, 语言) 分组只渲染一次再推送
+    
+    prefetched 为已获取的 {单元: 天气数据}，failed 为本次已获取失败的 {单元: 错误}，这些单元不再重复请求
+    """
+    cells = index.cells()
+    prefetched = prefetched or {}
+    failed = failed or {}
+    print(f"{len(index)} 个订阅者归并为 {len(cells)} 个网格单元")
+    RUN_METRICS.incr('grid_cells', len(cells))
+    
+    missing = [cell for cell in cells if cell not in prefetched and cell not in failed]
+    results, errors = get_weather_batch(missing) if missing else ({}, {})
+    errors.update((cell, failed[cell]) for cell in cells if cell in failed)
+    for cell, error in errors.items():
+        print(f"网格单元 {cell} 获取失败: {error}，跳过 {len(index.subscribers(cell))} 个订阅者")
+    results.update((cell, prefetched[cell]) for cell in cells if cell in prefetched)
+    
+    success = not errors
+    for cell in cells:
+        if cell in results:
+            pushed = push_groups_update(
+                results[cell], index.groups(cell), trigger_event,
+                location_name=index.name(cell), state_path=cell_state_path(cell)
+            )
+            success = pushed and success
+    return success
+
+def plan_fetch_locations():
+    """本次运行需要获取的地点：页面地点，加上订阅者所在、且不含页面地点的网格单元
+    
+    返回 (地点列表, 订阅者索引)，未配置 SUBSCRIBERS_FILE 时索引为 None
+    """
+    page_location = (LONGITUDE, LATITUDE)
+    if not SUBSCRIBERS_FILE:
+        return [page_location], None
+    index = build_location_index(load_subscribers())
+    page_cell = snap_to_grid(*page_location, index.resolution)
+    return [page_location] + [cell for cell in index.cells() if cell != page_cell], index
+
+def push_all_updates(weather_data, trigger_event="", fetched=None, index=None, errors=None):
+    """未配置订阅者位置文件时按原方式推送；否则按网格归并推送
+    
+    fetched 为本次已获取的 {(经度, 纬度): 天气数据}，errors 为本次获取失败的 {(经度, 纬度): 错误}，
+    所在网格直接复用结果或跳过，不再重复请求
+    """
+    if not SUBSCRIBERS_FILE:
+        return push_weather_update(weather_data, trigger_event)
+    if index is None:
+        index = build_location_index(load_subscribers())
+    prefetched = {snap_to_grid(*location, index.resolution): data for location, data in (fetched or {}).items()}
+    failed = {snap_to_grid(*location, index.resolution): error for location, error in (errors or {}).items()}
+    return push_subscribers_update(index, trigger_event, prefetched, failed)
+
+class CompiledTemplate:
+    """只解析一次的模板，渲染时按片段拼接；占位符使用 str.format 的 {name} 语法"""
+
+    def __init__(self, text):
+        self._parts = [
+            (literal, field)
+            for literal, field, _, _ in string.Formatter().parse(text)
+        ]
+
+    def render(self, values):
+        buffer = []
+        for literal, field in self._parts:
+            buffer.append(literal)
+            if field is not None:
+                buffer.append(str(values[field]))
+        return ''.join(buffer)
+
+# 输出文件是否压缩空白并生成 .gz/.br 预压缩版本
+MINIFY_OUTPUT = os.getenv("MINIFY_OUTPUT", "1") == "1"
+
+_HTML_BETWEEN_TAGS_RE = re.compile(r'>\s+<')
+_WHITESPACE_RE = re.compile(r'\s+')
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_PUNCTUATION_RE = re.compile(r'\s*([{};:,>])\s*')
+
+def minify_html(html):
+    """去掉标签之间的空白并把连续空白合并为一个空格"""
+    html = _HTML_BETWEEN_TAGS_RE.sub('><', html.strip())
+    return _WHITESPACE_RE.sub(' ', html)
+
+def minify_css(css):
+    """去掉注释和多余空白"""
+    css = _CSS_COMMENT_RE.sub('', css)
+    css = _WHITESPACE_RE.sub(' ', css)
+    css = _CSS_PUNCTUATION_RE.sub(r'\1', css)
+    return css.replace(';}', '}').strip()
+
+# 判断内容是否变化时忽略的易变字段（更新时间）
+_VOLATILE_RE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}')
+
+# 本次运行中内容确有变化的输出文件
+_changed_outputs = set()
+
+def content_digest(content):
+    """计算去掉更新时间后的内容哈希"""
+    return hashlib.sha256(_VOLATILE_RE.sub('', content).encode('utf-8')).hexdigest()
+
+def file_digest(path):
+    """计算已有文件的内容哈希，文件不存在时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return content_digest(f.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def write_file_atomic(path, data):
+    """先写同目录下的临时文件再替换，避免读到写了一半的文件"""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def write_output_file(path, content, minify=None):
+    """写出文本文件，按配置压缩空白并在旁边生成 .gz/.br 版本，返回各版本的字节数
+    
+    除更新时间外内容没有变化时不写入，返回值中 changed 为 False
+    """
+    raw = content.encode('utf-8')
+    if minify is not None and MINIFY_OUTPUT:
+        content = minify(content)
+    
+    if file_digest(path) == content_digest(content):
+        print(f"{path}: 内容未变化，跳过写入")
+        return {'raw': len(raw), 'written': 0, 'changed': False}
     
-    def get_wind_direction_text(degrees):
-        directions = ['北', '东北', '东', '东南', '南', '西南', '西', '西北']
-        index = round(((degrees + 22.5) % 360) / 45)
-        return directions[index % 8]
+    data = content.encode('utf-8')
+    write_file_atomic(path, data)
+    _changed_outputs.add(path)
     
-    wind_direction_text = get_wind_direction_text(weather_data['wind_direction'])
+    sizes = {'raw': len(raw), 'written': len(data), 'changed': True}
+    if MINIFY_OUTPUT:
+        # mtime 固定为 0，内容不变时压缩结果也不变
+        gz_data = gzip.compress(data, compresslevel=9, mtime=0)
+        write_file_atomic(f"{path}.gz", gz_data)
+        sizes['gzip'] = len(gz_data)
+        if brotli is not None:
+            br_data = brotli.compress(data, quality=11)
+            write_file_atomic(f"{path}.br", br_data)
+            sizes['br'] = len(br_data)
     
-    html = f"""
+    report = f"{path}: 原始 {sizes['raw']} 字节"
+    if sizes['written'] != sizes['raw']:
+        report += f"，压缩空白后 {sizes['written']} 字节（节省 {1 - sizes['written'] / sizes['raw']:.0%}）"
+    if 'gzip' in sizes:
+        report += f"，gzip {sizes['gzip']} 字节"
+    if 'br' in sizes:
+        report += f"，br {sizes['br']} 字节"
+    print(report)
+    return sizes
+
+def report_output_changes():
+    """输出本次是否有文件变化，供 GitHub Actions 决定是否提交和部署"""
+    changed = bool(_changed_outputs)
+    if changed:
+        print(f"有变化的文件: {', '.join(sorted(_changed_outputs))}")
+        _changed_outputs.clear()
+    else:
+        print("所有输出文件内容均未变化，可跳过提交和部署")
+    github_output = os.getenv("GITHUB_OUTPUT")
+    if github_output:
+        with open(github_output, 'a', encoding='utf-8') as f:
+            f.write(f"changed={'true' if changed else 'false'}\n")
+    return changed
+
+# 页面样式单独输出为带内容哈希的静态文件，内容不变时浏览器可长期缓存
+PAGE_CSS = """\
+* {
+    box-sizing: border-box;
+    -webkit-tap-highlight-color: transparent;
+}
+
+body {
+    font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
+    max-width: 100%;
+    margin: 0;
+    padding: 10px;
+    background-color: #f5f5f5;
+    color: #333;
+    line-height: 1.6;
+}
+
+@media (min-width: 768px) {
+    body {
+        padding: 20px;
+        max-width: 800px;
+        margin: 0 auto;
+    }
+}
+
+.container {
+    background: white;
+    border-radius: 15px;
+    padding: 15px;
+    box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+    margin-bottom: 15px;
+}
+
+.header {
+    text-align: center;
+    margin-bottom: 20px;
+    padding: 10px;
+    background: linear-gradient(135deg, #1a73e8, #4285f4);
+    color: white;
+    border-radius: 10px;
+}
+
+.header h1 {
+    margin: 0;
+    font-size: 1.5em;
+    padding: 10px 0;
+}
+
+.section {
+    margin: 15px 0;
+    padding: 15px;
+    background: #f8f9fa;
+    border-radius: 12px;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.05);
+}
+
+.section h2 {
+    margin-top: 0;
+    color: #1a73e8;
+    font-size: 1.2em;
+    display: flex;
+    align-items: center;
+    gap: 8px;
+}
+
+.current-weather {
+    display: flex;
+    flex-direction: column;
+    align-items: center;
+    padding: 15px;
+}
+
+.current-temp {
+    font-size: 3em;
+    font-weight: bold;
+    color: #1a73e8;
+    margin: 10px 0;
+}
+
+.weather-grid {
+    display: grid;
+    grid-template-columns: repeat(2, 1fr);
+    gap: 10px;
+    margin: 10px 0;
+}
+
+.weather-item {
+    padding: 10px;
+    background: white;
+    border-radius: 8px;
+    text-align: center;
+}
+
+.forecast-scroll {
+    overflow-x: auto;
+    -webkit-overflow-scrolling: touch;
+    scrollbar-width: none;
+    margin: 0 -15px;
+    padding: 15px;
+}
+
+.forecast-scroll::-webkit-scrollbar {
+    display: none;
+}
+
+.forecast-container {
+    display: flex;
+    gap: 12px;
+    padding: 0 15px;
+}
+
+.forecast-item {
+    flex: 0 0 100px;
+    background: white;
+    padding: 12px;
+    border-radius: 12px;
+    text-align: center;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+}
+
+.forecast-item .time {
+    font-weight: bold;
+    color: #1a73e8;
+}
+
+.weather-icon {
+    font-size: 2em;
+    margin: 8px 0;
+}
+
+.alert {
+    background: #fff3cd;
+    border-left: 4px solid #ffc107;
+    padding: 12px;
+    margin: 10px 0;
+    border-radius: 8px;
+}
+
+.alert h3 {
+    margin: 0 0 8px 0;
+    color: #856404;
+}
+
+.scroll-hint {
+    text-align: center;
+    color: #666;
+    font-size: 0.9em;
+    margin: 8px 0;
+    opacity: 0.8;
+}
+
+footer {
+    text-align: center;
+    margin-top: 20px;
+    padding: 15px;
+    color: #666;
+    font-size: 0.9em;
+}
+
+.daily-forecast {
+    display: flex;
+    gap: 12px;
+    overflow-x: auto;
+    -webkit-overflow-scrolling: touch;
+    scrollbar-width: none;
+    padding: 15px 0;
+}
+
+.daily-forecast::-webkit-scrollbar {
+    display: none;
+}
+
+.daily-item {
+    flex: 0 0 140px;
+    background: white;
+    padding: 12px;
+    border-radius: 12px;
+    text-align: center;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+}
+
+.daily-item .date {
+    font-weight: bold;
+    color: #1a73e8;
+}
+
+.daily-item .temp-range {
+    font-size: 1.1em;
+    margin: 8px 0;
+}
+
+@media (max-width: 480px) {
+    .weather-grid {
+        grid-template-columns: 1fr;
+    }
+
+    .forecast-item {
+        flex: 0 0 90px;
+        padding: 10px;
+    }
+
+    .daily-item {
+        flex: 0 0 120px;
+    }
+
+    .current-temp {
+        font-size: 2.5em;
+    }
+}
+"""
+STATIC_DIR = "static"
+FORECAST_JSON_PATH = "forecast.json"
+CSS_FILENAME = f"weather.{hashlib.sha256(PAGE_CSS.encode('utf-8')).hexdigest()[:10]}.css"
+
+HTML_PAGE_TEMPLATE = CompiledTemplate("""
     <!DOCTYPE html>
     <html lang="zh">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">
-        <title>长春市朝阳区天气预</title>
-        <style>
-            * {{
-                box-sizing: border-box;
-                -webkit-tap-highlight-color: transparent;
-            }}
-            
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-                max-width: 100%;
-                margin: 0;
-                padding: 10px;
-                background-color: #f5f5f5;
-                color: #333;
-                line-height: 1.6;
-            }}
-            
-            @media (min-width: 768px) {{
-                body {{
-                    padding: 20px;
-                    max-width: 800px;
-                    margin: 0 auto;
-                }}
-            }}
-            
-            .container {{
-                background: white;
-                border-radius: 15px;
-                padding: 15px;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-                margin-bottom: 15px;
-            }}
-            
-            .header {{
-                text-align: center;
-                margin-bottom: 20px;
-                padding: 10px;
-                background: linear-gradient(135deg, #1a73e8, #4285f4);
-                color: white;
-                border-radius: 10px;
-            }}
-            
-            .header h1 {{
-                margin: 0;
-                font-size: 1.5em;
-                padding: 10px 0;
-            }}
-            
-            .section {{
-                margin: 15px 0;
-                padding: 15px;
-                background: #f8f9fa;
-                border-radius: 12px;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-            }}
-            
-            .section h2 {{
-                margin-top: 0;
-                color: #1a73e8;
-                font-size: 1.2em;
-                display: flex;
-                align-items: center;
-                gap: 8px;
-            }}
-            
-            .current-weather {{
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                padding: 15px;
-            }}
-            
-            .current-temp {{
-                font-size: 3em;
-                font-weight: bold;
-                color: #1a73e8;
-                margin: 10px 0;
-            }}
-            
-            .weather-grid {{
-                display: grid;
-                grid-template-columns: repeat(2, 1fr);
-                gap: 10px;
-                margin: 10px 0;
-            }}
-            
-            .weather-item {{
-                padding: 10px;
-                background: white;
-                border-radius: 8px;
-                text-align: center;
-            }}
-            
-            .forecast-scroll {{
-                overflow-x: auto;
-                -webkit-overflow-scrolling: touch;
-                scrollbar-width: none;
-                margin: 0 -15px;
-                padding: 15px;
-            }}
-            
-            .forecast-scroll::-webkit-scrollbar {{
-                display: none;
-            }}
-            
-            .forecast-container {{
-                display: flex;
-                gap: 12px;
-                padding: 0 15px;
-            }}
-            
-            .forecast-item {{
-                flex: 0 0 100px;
-                background: white;
-                padding: 12px;
-                border-radius: 12px;
-                text-align: center;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            
-            .forecast-item .time {{
-                font-weight: bold;
-                color: #1a73e8;
-            }}
-            
-            .weather-icon {{
-                font-size: 2em;
-                margin: 8px 0;
-            }}
-            
-            .alert {{
-                background: #fff3cd;
-                border-left: 4px solid #ffc107;
-                padding: 12px;
-                margin: 10px 0;
-                border-radius: 8px;
-            }}
-            
-            .alert h3 {{
-                margin: 0 0 8px 0;
-                color: #856404;
-            }}
-            
-            .scroll-hint {{
-                text-align: center;
-                color: #666;
-                font-size: 0.9em;
-                margin: 8px 0;
-                opacity: 0.8;
-            }}
-            
-            footer {{
-                text-align: center;
-                margin-top: 20px;
-                padding: 15px;
-                color: #666;
-                font-size: 0.9em;
-            }}
-            
-            .daily-forecast {{
-                display: flex;
-                gap: 12px;
-                overflow-x: auto;
-                -webkit-overflow-scrolling: touch;
-                scrollbar-width: none;
-                padding: 15px 0;
-            }}
-            
-            .daily-forecast::-webkit-scrollbar {{
-                display: none;
-            }}
-            
-            .daily-item {{
-                flex: 0 0 140px;
-                background: white;
-                padding: 12px;
-                border-radius: 12px;
-                text-align: center;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-            }}
-            
-            .daily-item .date {{
-                font-weight: bold;
-                color: #1a73e8;
-            }}
-            
-            .daily-item .temp-range {{
-                font-size: 1.1em;
-                margin: 8px 0;
-            }}
-            
-            @media (max-width: 480px) {{
-                .weather-grid {{
-                    grid-template-columns: 1fr;
-                }}
-                
-                .forecast-item {{
-                    flex: 0 0 90px;
-                    padding: 10px;
-                }}
-                
-                .daily-item {{
-                    flex: 0 0 120px;
-                }}
-                
-                .current-temp {{
-                    font-size: 2.5em;
-                }}
-            }}
-        </style>
+        <title>{location_name}天气预报</title>
+        <link rel="stylesheet" href="{css_href}">
+        <meta name="version" content="{version}">
+        <meta name="forecast-version" content="{forecast_version}">
     </head>
     <body>
         <div class="container">
             <div class="header">
-                <h1>🌈 长春市朝阳区天气预报</h1>
-                <div>{current_time}</div>
+                <h1>🌈 {location_name}天气预报</h1>
+                <div data-field="updated_at">{current_time}</div>
+                {stale_notice}
             </div>
-"""
 
-    # 添加五天天气预报部分
-    html += """
             <div class="section">
                 <h2>📅 五天天气预报</h2>
                 <div class="scroll-hint">👈 左右滑动查看更多 👉</div>
                 <div class="daily-forecast">
-    """
-    
-    # 添加五天预报
-    for forecast in weather_data['daily_forecast']:
-        weather_icon = get_weather_icon(forecast['weather'])  # 使用统一的图标函数
-        html += f"""
-                    <div class="daily-item">
-                        <div class="date">{forecast['date']}</div>
-                        <div class="weather-icon">{weather_icon}</div>
-                        <div class="weather">{forecast['weather']}</div>
-                        <div class="temp-range">{forecast['temp_min']}° ~ {forecast['temp_max']}°</div>
-                    </div>
-        """
-    
-    html += """
+{daily_items}
                 </div>
             </div>
-    """
 
-    # 添加24小时预报部分
-    html += """
             <div class="section">
                 <h2>⏰ 24小时预报</h2>
                 <div class="scroll-hint">👈 左右滑动查看更多 👉</div>
                 <div class="forecast-scroll">
                     <div class="forecast-container">
-    """
-    
-    # 添加24小时预报
-    for forecast in weather_data['forecast']:
-        weather_icon = get_weather_icon(forecast['weather'], forecast['precipitation'])
-        precipitation_info = f'<div class="precipitation">降水：{forecast["precipitation"]:.1f}mm/h</div>' if forecast["precipitation"] > 0.0606 else ''
-        
-        html += f"""
-                        <div class="forecast-item">
-                            <div class="time">{forecast['time']}</div>
-                            <div class="weather-icon">{weather_icon}</div>
-                            <div class="temp">{forecast['temp']}°C</div>
-                            <div class="weather">{forecast['weather']}</div>
-                            {precipitation_info}
-                        </div>
-        """
-
-    html += """
+{hourly_items}
                     </div>
                 </div>
             </div>
-    """
-
-    # 添加预警信息
-    if weather_data['alerts']:
-        html += """
-            <div class="section">
-                <h2>⚠️ 气象预警</h2>
-        """
-        for alert in weather_data['alerts']:
-            html += f"""
-                <div class="alert">
-                    <h3>{alert['title']}</h3>
-                    <p>{alert['description']}</p>
-                </div>
-            """
-        html += "</div>"
-
-    # 在实时天气部分添加今日温区
-    today_forecast = weather_data['daily_forecast'][0]
-    today_temp_range = f"{today_forecast['temp_min']}°C ~ {today_forecast['temp_max']}°C"
-    
-    html += f"""
+{alerts_section}
             <div class="section">
                 <h2>📌 实时天气</h2>
                 <div class="current-weather">
-                    <div class="current-temp">{weather_data['current_temp']}°C</div>
-                    <div>体感温度：{weather_data['feels_like']}°C</div>
-                    <div>今日温区：{today_temp_range}</div>
-                    <div>{weather_data['weather']}</div>
+                    <div class="current-temp"><span data-field="temp">{current_temp}</span>°C</div>
+                    <div>体感温度：<span data-field="feels_like">{feels_like}</span>°C</div>
+                    <div>今日温区：<span data-field="today_range">{today_temp_range}</span></div>
+                    <div data-field="weather">{weather}</div>
                 </div>
             </div>
-    """
-
-    html += f"""
         </div>
         <footer>
             <p>数据来源：彩云天气</p>
-            <p>更新时间：{current_time}</p>
+            <p>更新时间：<span data-field="updated_at">{current_time}</span></p>
         </footer>
+        <script>{refresh_script}</script>
     </body>
     </html>
-    """
-    return html
+""")
+
+# 页面定时只拉取 forecast.json：版本未变时不做任何事；实时数据变化时就地更新，其余部分变化时才重新加载页面
+PAGE_REFRESH_SCRIPT = """
+(function () {
+    var meta = document.querySelector('meta[name="version"]');
+    var forecastMeta = document.querySelector('meta[name="forecast-version"]');
+    function refresh() {
+        fetch('""" + FORECAST_JSON_PATH + """', {cache: 'no-cache'}).then(function (r) {
+            return r.ok ? r.json() : null;
+        }).then(function (data) {
+            if (!data || data.version === meta.content) {
+                return;
+            }
+            if (data.forecast_version !== forecastMeta.content) {
+                location.reload();
+                return;
+            }
+            meta.content = data.version;
+            var values = Object.assign({updated_at: data.updated_at}, data.realtime);
+            document.querySelectorAll('[data-field]').forEach(function (el) {
+                var key = el.getAttribute('data-field');
+                if (values[key] !== undefined) {
+                    el.textContent = values[key];
+                }
+            });
+        }).catch(function () {});
+    }
+    setInterval(refresh, 10 * 60 * 1000);
+})();
+"""
+
+HTML_DAILY_ITEM_TEMPLATE = CompiledTemplate("""\
+                    <div class="daily-item">
+                        <div class="date">{date}</div>
+                        <div class="weather-icon">{icon}</div>
+                        <div class="weather">{weather}</div>
+                        <div class="temp-range">{temp_min}° ~ {temp_max}°</div>
+                    </div>""")
+
+HTML_HOURLY_ITEM_TEMPLATE = CompiledTemplate("""\
+                        <div class="forecast-item">
+                            <div class="time">{time}</div>
+                            <div class="weather-icon">{icon}</div>
+                            <div class="temp">{temp}°C</div>
+                            <div class="weather">{weather}</div>
+                            {precipitation_info}
+                        </div>""")
+
+HTML_ALERT_TEMPLATE = CompiledTemplate("""\
+                <div class="alert">
+                    <h3>{title}</h3>
+                    <p>{description}</p>
+                </div>""")
+
+def generate_html_content(weather_data):
+    """生成HTML格式的天气信息"""
+    view = as_weather_view(weather_data)
+    data = view.data
+    snapshot = build_forecast_snapshot(view)
+    
+    # 五天预报
+    daily_items = "\n".join(
+        HTML_DAILY_ITEM_TEMPLATE.render(forecast._asdict()) for forecast in view.daily
+    )
+    
+    # 24小时预报
+    hourly_items = []
+    for forecast in view.hourly:
+        values = forecast._asdict()
+        values['precipitation_info'] = f'<div class="precipitation">降水：{forecast.precipitation:.1f}mm/h</div>' if forecast.precipitation > 0.0606 else ''
+        hourly_items.append(HTML_HOURLY_ITEM_TEMPLATE.render(values))
+    
+    # 预警信息
+    alerts_section = ''
+    if view.alerts:
+        alerts_section = ''.join([
+            '            <div class="section">\n                <h2>⚠️ 气象预警</h2>\n',
+            "\n".join(HTML_ALERT_TEMPLATE.render(alert) for alert in view.alerts),
+            '\n            </div>\n',
+        ])
+    
+    return HTML_PAGE_TEMPLATE.render({
+        'css_href': f"{STATIC_DIR}/{CSS_FILENAME}",
+        'location_name': LOCATION_NAME,
+        **{key: snapshot[key] for key in ('version', 'forecast_version')},
+        'refresh_script': PAGE_REFRESH_SCRIPT,
+        'current_time': view.current_time,
+        'stale_notice': '<div>⚠️ 天气接口暂时不可用，当前为最近一次获取的数据</div>' if view.stale else '',
+        'daily_items': daily_items,
+        'hourly_items': "\n".join(hourly_items),
+        'alerts_section': alerts_section,
+        'current_temp': data['current_temp'],
+        'feels_like': data['feels_like'],
+        'today_temp_range': view.today_temp_range,
+        'weather': data['weather'],
+    })
+
+def build_forecast_snapshot(weather_data):
+    """生成 forecast.json 的内容：实时、逐小时、逐日预报和预警，version 为数据内容的哈希"""
+    view = as_weather_view(weather_data)
+    data = view.data
+    snapshot = {
+        'realtime': {
+            'temp': data['current_temp'],
+            'feels_like': data['feels_like'],
+            'weather': data['weather'],
+            'humidity': data['humidity'],
+            'visibility': data['visibility'],
+            'wind_speed': data['wind_speed'],
+            'wind_direction': data['wind_direction'],
+            'pressure': data['pressure'],
+            'aqi': data['aqi'],
+            'pm25': data['pm25'],
+            'comfort': data['comfort'],
+            'ultraviolet': data['ultraviolet'],
+            'today_range': view.today_temp_range,
+        },
+        # 逐小时、逐日数据按列表存储，减少重复的键名
+        'hourly': {
+            'fields': ['time', 'temp', 'weather', 'precipitation'],
+            'rows': [[f.time, f.temp, f.weather, f.precipitation] for f in view.hourly],
+        },
+        'daily': {
+            'fields': ['date', 'temp_min', 'temp_max', 'weather'],
+            'rows': [[d.date, d.temp_min, d.temp_max, d.weather] for d in view.daily],
+        },
+        'alerts': [
+            {'title': alert.get('title', ''), 'description': alert.get('description', '')}
+            for alert in view.alerts
+        ],
+        'stale': view.stale,
+    }
+    # 版本号只由天气数据决定，不包含生成时间；forecast_version 只覆盖预报和预警部分
+    def digest(value):
+        raw = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+    
+    snapshot['forecast_version'] = digest([snapshot['hourly'], snapshot['daily'], snapshot['alerts']])
+    snapshot['version'] = digest(snapshot)
+    snapshot['updated_at'] = view.current_time
+    return snapshot
+
+def generate_forecast_json(weather_data):
+    """序列化为紧凑的 JSON 字符串"""
+    snapshot = build_forecast_snapshot(weather_data)
+    return json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+
+def write_forecast_json(content):
+    """写出 forecast.json 及其预压缩版本"""
+    try:
+        write_output_file(FORECAST_JSON_PATH, content)
+        return True
+    except OSError as e:
+        print(f"写入 {FORECAST_JSON_PATH} 时发生错误: {str(e)}")
+        return False
+
+def write_static_assets():
+    """写出带哈希的样式文件，并删除旧版本"""
+    css_path = os.path.join(STATIC_DIR, CSS_FILENAME)
+    if os.path.exists(css_path):
+        return css_path
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    write_output_file(css_path, PAGE_CSS, minify=minify_css)
+    for name in os.listdir(STATIC_DIR):
+        if name.startswith('weather.') and not name.startswith(CSS_FILENAME):
+            os.remove(os.path.join(STATIC_DIR, name))
+    print(f"已生成样式文件: {css_path}")
+    return css_path
 
 def upload_to_github(content):
-    """更新根目录下的 index.html 文件"""
+    """更新根目录下的 index.html 文件及其引用的样式文件"""
     try:
         # 直接写入本地文件
         try:
-            with open('index.html', 'w', encoding='utf-8') as f:
-                f.write(content)
-            print("成功更新本地 index.html 文件")
-            
-            # 验证文件是否正确写入
-            with open('index.html', 'r', encoding='utf-8') as f:
-                written_content = f.read()
-                if written_content == content:
-                    print("文件内容验证成功")
-                else:
-                    print("警告：文件内容可能未正确写入")
+            write_static_assets()
+            if write_output_file('index.html', content, minify=minify_html)['changed']:
+                print("成功更新本地 index.html 文件")
             return True
         except Exception as e:
             print(f"写入文件时发生错误: {str(e)}")
@@ -741,7 +2201,7 @@ def upload_to_github(content):
         print(f"错误堆栈: {traceback.format_exc()}")
         return False
 
-def generate_short_message(weather_data):
+def generate_short_message(weather_data, location_name=None):
     """生成简短的天气消息"""
     # 获取触发事件类型
     trigger_event = os.getenv("TRIGGER_EVENT", "")
@@ -749,16 +2209,9 @@ def generate_short_message(weather_data):
     if not weather_data:
         return "获取天气信息失败"
     
-    current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
-    
-    # 获取风向的文字描述
-    def get_wind_direction_text(degrees):
-        directions = ['北', '东北', '东', '东南', '南', '西南', '西', '西北']
-        index = round(((degrees + 22.5) % 360) / 45)
-        return directions[index % 8]
-    
-    # 计算风向文字
-    wind_direction_text = get_wind_direction_text(weather_data['wind_direction'])
+    view = as_weather_view(weather_data)
+    data = view.data
+    current_time = view.current_time
     
     # 根据触发事件添加不同的标题
     if trigger_event == "watch":
@@ -767,69 +2220,46 @@ def generate_short_message(weather_data):
 📅 更新时间：{current_time}
 """
     else:
-        message = f"""🌈 长春市朝阳区天气预报
+        message = f"""🌈 {location_name or LOCATION_NAME}天气预报
 ━━━━━━━━━━
 📅 更新时间：{current_time}
 """
     
-    # 获取今天的温度区间
-    today_forecast = weather_data['daily_forecast'][0]
-    today_temp_range = f"{today_forecast['temp_min']}°C ~ {today_forecast['temp_max']}°C"
-    
-    # 分析天气趋势
-    rain_hours = sum(1 for f in weather_data['forecast'][:24] if "雨" in f['weather'] or f['precipitation'] > 0.0606)
-    snow_hours = sum(1 for f in weather_data['forecast'][:24] if "雪" in f['weather'])
-    
     message += f"""
 ━━━━━━━━━━━━
 📅 更新时间：{current_time}
 
 🌡️ 实时天气
 """
-    # 删除重复的时间显示部分
-    message += f"""• 当前温度：{weather_data['current_temp']}°C
-• 体感温度：{weather_data['feels_like']}°C
-• 天气状况：{weather_data['weather']}
-• 今日温区：{today_temp_range}
-• 相对湿度：{weather_data['humidity']}%
+    if view.stale:
+        message += "⚠️ 天气接口暂时不可用，以下为最近一次获取的数据\n"
+    message += f"""• 当前温度：{data['current_temp']}°C
+• 体感温度：{data['feels_like']}°C
+• 天气状况：{data['weather']}
+• 今日温区：{view.today_temp_range}
+• 相对湿度：{data['humidity']}%
 """
 
     # 添加五天预报
-    for forecast in weather_data['daily_forecast']:
-        weather_icon = get_weather_icon(forecast['weather'])
-        message += f"\n• {forecast['date']} {weather_icon} {forecast['temp_min']}°C ~ {forecast['temp_max']}°C {forecast['weather']}"
+    for forecast in view.daily:
+        message += f"\n• {forecast.date} {forecast.icon} {forecast.temp_min}°C ~ {forecast.temp_max}°C {forecast.weather}"
 
     message += "\n\n【未来6小时天气】"
 
     # 添加未来6小时预报
-    for i, forecast in enumerate(weather_data['forecast']):
-        if i < 6:
-            precip_desc = get_precipitation_description(forecast['precipitation'])
-            weather_desc = forecast['weather'] if not precip_desc else precip_desc
-            weather_icon = get_weather_icon(weather_desc, forecast['precipitation'])
-            
-            # 修改降水量显示格式
-            precipitation = f" | 降水 {forecast['precipitation']:.1f}mm/h" if forecast['precipitation'] > 0.0606 else ""
-            message += f"\n• {forecast['time']} {weather_icon} {forecast['temp']}°C {weather_desc}{precipitation}"
+    for forecast in view.hourly[:6]:
+        # 修改降水量显示格式
+        precipitation = f" | 降水 {forecast.precipitation:.1f}mm/h" if forecast.precipitation > 0.0606 else ""
+        message += f"\n• {forecast.time} {forecast.icon} {forecast.temp}°C {forecast.short_weather}{precipitation}"
 
     # 添加天气提醒
-    weather_tips = []
-    if rain_hours > 0:
-        weather_tips.append(f"未来24小时有{rain_hours}小时降雨")
-    if snow_hours > 0:
-        weather_tips.append(f"未来24小时有{snow_hours}小时降雪")
-    if weather_data['humidity'] >= 80:
-        weather_tips.append("湿度较大，注意防潮")
-    if int(weather_data['pm25']) > 75:
-        weather_tips.append("空气质量一般，建议戴口罩")
-
-    if weather_tips:
-        message += "\n\n⚠️ 天气提醒\n" + "\n".join(f"• {tip}" for tip in weather_tips)
+    if view.weather_tips:
+        message += "\n\n⚠️ 天气提醒\n" + "\n".join(f"• {tip}" for tip in view.weather_tips)
 
     # 添加预警信息（如果有）
-    if weather_data['alerts']:
+    if view.alerts:
         message += "\n\n🚨 预警信息"
-        for alert in weather_data['alerts']:
+        for alert in view.alerts:
             message += f"\n• {alert['title']}"
 
     # 修改链接为正确的地址
@@ -838,33 +2268,605 @@ def generate_short_message(weather_data):
     
     return message
 
+# 推送消息模板，订阅者配置中的 template 字段取这里的键
+MESSAGE_TEMPLATES = {
+    'short': generate_short_message,
+    'detail': format_weather_message,
+}
+
+def fetch_alerts(longitude=LONGITUDE, latitude=LATITUDE):
+    """只请求实时天气和预警，返回预警列表"""
+    return fetch_profile('alert', longitude, latitude)
+
+def alert_key(alert):
+    """预警的唯一标识，缺少 alertId 时用标题和发布时间代替"""
+    return alert['alert_id'] or f"{alert['title']}|{alert['pubtimestamp']}"
+
+def mark_alerts_seen(alerts):
+    """记录已推送过的预警，并清理超过保留时间的记录；返回其中新出现的预警"""
+    state = load_json_state(SEEN_ALERTS_PATH)
+    seen = state.get('alerts', {})
+    now = time.time()
+    new_alerts = [alert for alert in alerts if alert_key(alert) not in seen]
+    for alert in new_alerts:
+        seen[alert_key(alert)] = now
+    seen = {key: seen_at for key, seen_at in seen.items() if now - seen_at <= SEEN_ALERTS_MAX_AGE}
+    save_json_state(SEEN_ALERTS_PATH, {'alerts': seen})
+    return new_alerts
+
+def generate_alert_message(alerts):
+    """生成新预警的推送内容"""
+    message = "🚨 新的气象预警"
+    for alert in alerts:
+        message += f"\n━━━━━━━━━━\n**{alert['title']}**\n{alert['description']}"
+    message += f"\n\n📱 [点击查看详细天气预报](https://207279525.github.io/weather-report/)"
+    return message
+
+def poll_alerts_once():
+    """轮询一次预警，有新预警时立即推送；返回推送的新预警数量"""
+    try:
+        alerts = fetch_alerts()
+    except WeatherFetchError as e:
+        print(f"获取预警信息失败: {str(e)}")
+        return 0
+    
+    state = load_json_state(SEEN_ALERTS_PATH).get('alerts', {})
+    new_alerts = [alert for alert in alerts if alert_key(alert) not in state]
+    if not new_alerts:
+        print(f"没有新的预警（当前生效 {len(alerts)} 条）")
+        return 0
+    
+    print(f"发现 {len(new_alerts)} 条新预警: {'，'.join(alert['title'] for alert in new_alerts)}")
+    if push_to_wxpusher(generate_alert_message(new_alerts)):
+        mark_alerts_seen(new_alerts)
+        return len(new_alerts)
+    return 0
+
+def watch_alerts():
+    """预警监控模式：按 ALERT_POLL_INTERVAL 秒轮询，ALERT_POLL_ONCE=1 时只轮询一次"""
+    print(f"开始监控气象预警，轮询间隔 {ALERT_POLL_INTERVAL} 秒")
+    while True:
+        poll_alerts_once()
+        if ALERT_POLL_ONCE:
+            break
+        time.sleep(ALERT_POLL_INTERVAL)
+
+def fetch_nowcast(longitude=LONGITUDE, latitude=LATITUDE):
+    """请求未来两小时逐分钟降水预报，返回 (服务器时间, 逐分钟降水强度, 文字描述)"""
+    return fetch_profile('nowcast', longitude, latitude)
+
+def detect_rain_window(precipitation, threshold=PRECIPITATION_THRESHOLDS[0]):
+    """找出降雨开始和停止是第几分钟；未来两小时无雨时返回 (None, None)，雨不停时停止分钟为 None"""
+    start = next((i for i, value in enumerate(precipitation) if value >= threshold), None)
+    if start is None:
+        return None, None
+    stop = next((i for i in range(start, len(precipitation)) if precipitation[i] < threshold), None)
+    return start, stop
+
+def build_nowcast_prediction(server_time, precipitation):
+    """把逐分钟降水换算成降雨开始、停止的绝对时间"""
+    start, stop = detect_rain_window(precipitation)
+    return {
+        'start_at': None if start is None else server_time + start * 60,
+        'stop_at': None if stop is None else server_time + stop * 60,
+        'raining_now': start == 0,
+    }
+
+def nowcast_changed(previous, current):
+    """判断降雨预测是否有值得通知的变化"""
+    if not previous:
+        # 第一次运行：只有预测到降雨才通知
+        return current['start_at'] is not None
+    tolerance = NOWCAST_TOLERANCE * 60
+    # 持续下雨时开始时间就是每次轮询的服务器时间，会一直后移，只比较停止时间
+    keys = ('stop_at',) if previous.get('raining_now') and current['raining_now'] else ('start_at', 'stop_at')
+    for key in keys:
+        before, after = previous.get(key), current[key]
+        if (before is None) != (after is None):
+            return True
+        if before is not None and abs(after - before) > tolerance:
+            return True
+    return False
+
+def generate_nowcast_message(prediction, description):
+    """生成降雨提醒内容"""
+    tz = pytz.timezone('Asia/Shanghai')
+    
+    def clock(timestamp):
+        return datetime.fromtimestamp(timestamp, tz).strftime("%H:%M")
+    
+    if prediction['start_at'] is None:
+        message = "🌤️ 降雨提醒：未来两小时不会下雨了"
+    elif prediction['raining_now']:
+        message = "☔ 降雨提醒：正在下雨"
+        message += f"，预计 {clock(prediction['stop_at'])} 左右停止" if prediction['stop_at'] else "，两小时内不会停"
+    else:
+        message = f"🌂 降雨提醒：预计 {clock(prediction['start_at'])} 开始下雨"
+        if prediction['stop_at']:
+            message += f"，{clock(prediction['stop_at'])} 左右停止"
+    if description:
+        message += f"\n{description}"
+    return message
+
+def poll_nowcast_once():
+    """轮询一次短临降水预报，降雨预测有变化时推送；返回是否推送"""
+    try:
+        server_time, precipitation, description = fetch_nowcast()
+    except WeatherFetchError as e:
+        print(f"获取短临降水预报失败: {str(e)}")
+        return False
+    
+    prediction = build_nowcast_prediction(server_time, precipitation)
+    previous = load_json_state(NOWCAST_STATE_PATH).get('prediction')
+    if not nowcast_changed(previous, prediction):
+        print(f"降雨预测无变化: {description}")
+        return False
+    
+    if push_to_wxpusher(generate_nowcast_message(prediction, description)):
+        save_json_state(NOWCAST_STATE_PATH, {'prediction': prediction})
+        return True
+    return False
+
+def watch_nowcast():
+    """短临降水监控模式：按 NOWCAST_POLL_INTERVAL 秒轮询，NOWCAST_POLL_ONCE=1 时只轮询一次"""
+    print(f"开始监控短临降水，轮询间隔 {NOWCAST_POLL_INTERVAL} 秒")
+    while True:
+        poll_nowcast_once()
+        if NOWCAST_POLL_ONCE:
+            break
+        time.sleep(NOWCAST_POLL_INTERVAL)
+
+def format_run_metrics(record, timestamp):
+    """把一次运行的指标记录转换为 Prometheus 文本格式的行"""
+    stages = {}
+    for span in record['spans']:
+        total, count = stages.get(span['name'], (0.0, 0))
+        stages[span['name']] = (total + span['seconds'], count + 1)
+    lines = [
+        "# HELP weather_stage_seconds Time spent in each pipeline stage during the last run.",
+        "# TYPE weather_stage_seconds gauge",
+    ]
+    lines += [f'weather_stage_seconds{{stage="{name}"}} {total:.6f}' for name, (total, _) in sorted(stages.items())]
+    lines += ["# TYPE weather_stage_count gauge"]
+    lines += [f'weather_stage_count{{stage="{name}"}} {count}' for name, (_, count) in sorted(stages.items())]
+    lines += ["# TYPE weather_run_counter gauge"]
+    lines += [f'weather_run_counter{{name="{name}"}} {value}' for name, value in sorted(record['counters'].items())]
+    lines += [
+        "# TYPE weather_run_seconds gauge",
+        f"weather_run_seconds {record['total_seconds']:.6f}",
+        "# TYPE weather_run_timestamp_seconds gauge",
+        f"weather_run_timestamp_seconds {timestamp:.0f}",
+    ]
+    return lines
+
+def export_run_metrics(jsonl=True, **extra):
+    """把本次运行的指标追加到 JSON Lines 文件，并按配置写出 Prometheus textfile
+    
+    服务模式会一直刷新，传 jsonl=False 不追加记录，指标通过 /metrics 提供
+    """
+    record = RUN_METRICS.snapshot(**extra)
+    if jsonl:
+        try:
+            os.makedirs(os.path.dirname(METRICS_JSONL) or '.', exist_ok=True)
+            with open(METRICS_JSONL, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+        except OSError as e:
+            print(f"写入运行指标失败: {str(e)}")
+    
+    if METRICS_PROM_FILE:
+        lines = format_run_metrics(record, RUN_METRICS.started_at)
+        try:
+            write_file_atomic(METRICS_PROM_FILE, ("\n".join(lines) + "\n").encode('utf-8'))
+        except OSError as e:
+            print(f"写入 Prometheus 指标失败: {str(e)}")
+    
+    stage_summary = "，".join(f"{span['name']} {span['seconds'] * 1000:.1f}ms" for span in record['spans'])
+    print(f"阶段耗时: {stage_summary}")
+    return record
+
 def main():
     """主函数"""
     print("开始执行天气推送任务...")
+    RUN_METRICS.reset()
     
     # 获取触发事件类型
     trigger_event = os.getenv("TRIGGER_EVENT", "")
     print(f"触发事件类型: {trigger_event}")
     
-    weather_data = get_weather()
+    # 页面地点和订阅者所在网格一次批量获取，推送时不再单独请求
+    locations, index = plan_fetch_locations()
+    with RUN_METRICS.span('fetch', locations=len(locations)):
+        results, errors = get_weather_batch(locations)
+    for location, error in errors.items():
+        print(f"地点 {location} 获取失败: {error}")
+    weather_data = results.get(locations[0])
+    view = None
     if weather_data:
+        # 派生字段只计算一次，页面和消息共用
+        with RUN_METRICS.span('render.view'):
+            view = as_weather_view(weather_data)
+        
         # 总是生成并更新 HTML 内容，不再根据触发事件类型判断
-        html_content = generate_html_content(weather_data)
-        if upload_to_github(html_content):
+        with RUN_METRICS.span('render.html'):
+            html_content = generate_html_content(view)
+        with RUN_METRICS.span('write.html'):
+            uploaded = upload_to_github(html_content)
+        if uploaded:
             print("HTML内容已成功上传到GitHub Pages")
         else:
             print("上传HTML内容失败")
-        
-        # 生成并推送消息
-        message = generate_short_message(weather_data)
-        success = push_to_wxpusher(message)
-        print(f"任务执行{'成功' if success else '失败'}")
+        with RUN_METRICS.span('render.json'):
+            forecast_json = generate_forecast_json(view)
+        with RUN_METRICS.span('write.json'):
+            write_forecast_json(forecast_json)
+        report_output_changes()
     else:
         print("获取天气数据失败")
+    
+    # 生成并推送消息（天气无实质变化时按配置跳过或改为简短通知）；页面地点获取失败时其他网格的订阅者照常推送
+    pushed = False
+    if weather_data or SUBSCRIBERS_FILE:
+        with RUN_METRICS.span('push'):
+            pushed = push_all_updates(view, trigger_event, results, index, errors)
+    success = bool(weather_data) and pushed
+    print(f"任务执行{'成功' if success else '失败'}")
+    export_run_metrics(mode="sync", trigger=trigger_event, success=success)
+
+    stats = get_connection_stats()
+    print(f"HTTP连接统计: 新建 {stats['connections']} 个连接, 请求 {stats['requests']} 次, 复用 {stats['reused']} 次")
 
     # 打印当前时间，用于调试
     current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
     print(f"任务完成时间: {current_time}")
 
+async def async_main():
+    """异步主函数：并发获取页面和订阅者所需的天气，页面写入与消息推送并行执行"""
+    print("开始执行天气推送任务（异步模式）...")
+    RUN_METRICS.reset()
+    
+    trigger_event = os.getenv("TRIGGER_EVENT", "")
+    print(f"触发事件类型: {trigger_event}")
+    
+    # 页面地点和订阅者所在网格并发获取，第一个地点用于生成页面
+    locations, index = plan_fetch_locations()
+    with RUN_METRICS.span('fetch', locations=len(locations)):
+        results, errors = await get_weather_batch_async(locations)
+    for location, error in errors.items():
+        print(f"地点 {location} 获取失败: {error}")
+    weather_data = results.get(locations[0])
+    
+    # 写入页面和推送消息互不依赖，同时进行；页面地点获取失败时其他网格的订阅者照常推送
+    view = None
+    tasks = []
+    if weather_data:
+        with RUN_METRICS.span('render.view'):
+            view = as_weather_view(weather_data)
+        with RUN_METRICS.span('render.html'):
+            html_content = generate_html_content(view)
+        with RUN_METRICS.span('render.json'):
+            forecast_json = generate_forecast_json(view)
+        tasks += [
+            asyncio.to_thread(upload_to_github, html_content),
+            asyncio.to_thread(write_forecast_json, forecast_json),
+        ]
+    else:
+        print("获取天气数据失败")
+    if weather_data or SUBSCRIBERS_FILE:
+        tasks.append(asyncio.to_thread(push_all_updates, view, trigger_event, results, index, errors))
+    
+    with RUN_METRICS.span('publish'):
+        outcomes = await asyncio.gather(*tasks)
+    pushed = bool(outcomes) and outcomes[-1]
+    if weather_data:
+        print("HTML内容已成功上传到GitHub Pages" if outcomes[0] else "上传HTML内容失败")
+        report_output_changes()
+    success = bool(weather_data) and pushed
+    print(f"任务执行{'成功' if success else '失败'}")
+    export_run_metrics(mode="async", trigger=trigger_event, success=success)
+
+    stats = get_connection_stats()
+    print(f"HTTP连接统计: 新建 {stats['connections']} 个连接, 请求 {stats['requests']} 次, 复用 {stats['reused']} 次")
+
+    current_time = datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"任务完成时间: {current_time}")
+
+class ServedResource(NamedTuple):
+    """服务模式下缓存在内存中的响应，bodies 为 {编码: 字节}"""
+    content_type: str
+    etag: str
+    bodies: dict
+
+def build_served_resource(content, content_type, minify=None):
+    """渲染结果在刷新时一次性压缩好，请求时按 Accept-Encoding 直接返回"""
+    if minify is not None and MINIFY_OUTPUT:
+        content = minify(content)
+    data = content.encode('utf-8')
+    bodies = {'identity': data, 'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(data, quality=11)
+    return ServedResource(content_type, f'"{hashlib.sha256(data).hexdigest()[:16]}"', bodies)
+
+class WeatherService:
+    """服务模式的内存状态：最近一次的天气快照和渲染结果，由后台线程定时刷新"""
+
+    def __init__(self, interval=None):
+        self.interval = SERVE_REFRESH_INTERVAL if interval is None else interval
+        # 路径 -> ServedResource，刷新时整体替换，读取时不需要加锁
+        self.resources = {}
+        self.snapshot = None
+        self.updated_at = 0.0
+        self.last_error = ""
+        self.last_run = None
+        self.counters = {'refreshes': 0, 'refresh_failures': 0, 'requests': 0, 'not_modified': 0, 'not_found': 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # 样式文件内容固定，只需生成一次
+        self.static_resources = {
+            f"/{STATIC_DIR}/{CSS_FILENAME}": build_served_resource(PAGE_CSS, 'text/css; charset=utf-8', minify_css),
+        }
+
+    def refresh(self):
+        """获取天气并渲染页面和 JSON，失败时继续提供上一次的内容"""
+        RUN_METRICS.reset()
+        # 定时刷新总是请求接口，磁盘缓存只在接口失败时作为回退
+        with RUN_METRICS.span('fetch'):
+            weather_data = get_weather(LONGITUDE, LATITUDE, max_age=0)
+        if weather_data is None:
+            self.incr('refresh_failures')
+            self.last_error = "获取天气数据失败"
+            export_run_metrics(jsonl=False, mode="serve", success=False)
+            return False
+        
+        with RUN_METRICS.span('render.view'):
+            view = as_weather_view(weather_data)
+        with RUN_METRICS.span('render.html'):
+            page = build_served_resource(generate_html_content(view), 'text/html; charset=utf-8', minify_html)
+        with RUN_METRICS.span('render.json'):
+            forecast = build_served_resource(generate_forecast_json(view), 'application/json; charset=utf-8')
+        resources = {'/': page, '/index.html': page, f"/{FORECAST_JSON_PATH}": forecast, **self.static_resources}
+        
+        self.resources = resources
+        self.snapshot = weather_data
+        self.updated_at = time.time()
+        self.last_run = export_run_metrics(jsonl=False, mode="serve", success=not view.stale)
+        # 接口不可用时 get_weather 返回的是旧缓存，页面照常提供，但这次刷新算作失败
+        if view.stale:
+            self.incr('refresh_failures')
+            self.last_error = "天气接口请求失败，正在提供过期缓存数据"
+            return False
+        self.last_error = ""
+        self.incr('refreshes')
+        return True
+
+    def refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                self.incr('refresh_failures')
+                self.last_error = str(e)
+                print(f"后台刷新出错: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        thread = threading.Thread(target=self.refresh_loop, name="weather-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def health(self):
+        """返回 (状态, 详情)，状态为 ok、degraded（正在提供过期缓存数据）、stale 或 starting"""
+        age = time.time() - self.updated_at if self.updated_at else None
+        stale_upstream = bool(self.snapshot is not None and as_weather_view(self.snapshot).stale)
+        if age is None:
+            status = "starting"
+        elif age > self.interval * 3:
+            status = "stale"
+        elif stale_upstream:
+            status = "degraded"
+        else:
+            status = "ok"
+        return status, {
+            'status': status,
+            'data_age_seconds': round(age, 1) if age is not None else None,
+            'stale_upstream': stale_upstream,
+            'last_error': self.last_error,
+            **self.counters,
+        }
+
+    def metrics(self):
+        """服务自身的计数和最近一次刷新的阶段耗时，Prometheus 文本格式"""
+        with self._lock:
+            counters = dict(self.counters)
+        lines = ["# TYPE weather_service_events_total counter"]
+        lines += [f'weather_service_events_total{{event="{name}"}} {value}' for name, value in sorted(counters.items())]
+        lines += ["# TYPE weather_service_data_age_seconds gauge"]
+        lines += [f"weather_service_data_age_seconds {time.time() - self.updated_at:.1f}" if self.updated_at else "weather_service_data_age_seconds NaN"]
+        if self.last_run is not None:
+            lines += format_run_metrics(self.last_run, self.updated_at)
+        return "\n".join(lines) + "\n"
+
+class WeatherRequestHandler(BaseHTTPRequestHandler):
+    """服务模式的请求处理：页面和 JSON 直接返回内存中已压缩的字节"""
+    protocol_version = "HTTP/1.1"
+    server_version = "WeatherReport"
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def handle_request(self, send_body):
+        service = self.server.service
+        service.incr('requests')
+        path = self.path.split('?', 1)[0]
+        
+        if path == '/healthz':
+            status, detail = service.health()
+            body = json.dumps(detail, ensure_ascii=False).encode('utf-8')
+            self.send_bytes(200 if status == "ok" else 503, 'application/json; charset=utf-8', body, send_body)
+            return
+        if path == '/metrics':
+            self.send_bytes(200, 'text/plain; version=0.0.4', service.metrics().encode('utf-8'), send_body)
+            return
+        
+        resource = service.resources.get(path) or service.static_resources.get(path)
+        if resource is None:
+            if not service.resources and path in ('/', '/index.html', f"/{FORECAST_JSON_PATH}"):
+                self.send_bytes(503, 'text/plain; charset=utf-8', "天气数据加载中".encode('utf-8'), send_body)
+            else:
+                service.incr('not_found')
+                self.send_bytes(404, 'text/plain; charset=utf-8', b"not found", send_body)
+            return
+        
+        headers = {'ETag': resource.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if self.headers.get('If-None-Match') == resource.etag:
+            service.incr('not_modified')
+            self.send_bytes(304, None, b"", False, headers)
+            return
+        accepted = self.headers.get('Accept-Encoding', '')
+        encoding = next((name for name in ('br', 'gzip') if name in accepted and name in resource.bodies), 'identity')
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        self.send_bytes(200, resource.content_type, resource.bodies[encoding], send_body, headers)
+
+    def send_bytes(self, status, content_type, body, send_body, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        # 访问量大时逐条打印访问日志的开销比处理请求本身还大，只保留 log_error 输出的错误
+        pass
+
+def serve(host=None, port=None):
+    """服务模式：后台定时刷新天气，通过 HTTP 提供页面、forecast.json、/healthz 和 /metrics"""
+    service = WeatherService()
+    server = ThreadingHTTPServer((host or SERVE_HOST, port or SERVE_PORT), WeatherRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    service.start()
+    
+    # 收到 SIGTERM 时在其他线程里关闭服务，serve_forever 随后返回
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"天气服务已启动: http://{server.server_address[0]}:{server.server_address[1]}/，每 {service.interval:.0f} 秒刷新一次")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        print("天气服务已停止")
+
+def profile_call(name, func, *args):
+    """在 cProfile 和 tracemalloc 下执行 func，把 CPU 和内存分配报告写入 PROFILE_DIR"""
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+    
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    tracemalloc.start(25)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        result = profiler.runcall(func, *args)
+    finally:
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer).strip_dirs()
+        buffer.write(f"{name}: 总耗时 {elapsed:.4f}s\n\n按累计耗时排序:\n")
+        stats.sort_stats('cumulative').print_stats(40)
+        buffer.write("\n按自身耗时排序:\n")
+        stats.sort_stats('tottime').print_stats(40)
+        with open(os.path.join(PROFILE_DIR, f"{name}_cpu.txt"), 'w', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+        
+        # 快照记录的是运行结束时仍未释放的分配，峰值单独列出
+        lines = [f"{name}: 当前 {current / 1024:.1f} KiB，峰值 {peak / 1024:.1f} KiB", "", "按代码行:"]
+        lines += [str(stat) for stat in snapshot.statistics('lineno')[:40]]
+        lines += ["", "按文件:"]
+        lines += [str(stat) for stat in snapshot.statistics('filename')[:20]]
+        with open(os.path.join(PROFILE_DIR, f"{name}_alloc.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+    print(f"性能分析 {name}: {elapsed:.4f}s，内存峰值 {peak / 1024:.1f} KiB，报告已写入 {PROFILE_DIR}")
+    return result
+
+def render_loop(payload, loops):
+    """重复执行解析和各渲染函数，返回每个函数的平均耗时（毫秒）"""
+    weather_data = parse_weather_payload(payload)
+    view = build_weather_view(weather_data)
+    stages = [
+        ('parse_weather_payload', parse_weather_payload, payload),
+        ('build_weather_view', build_weather_view, weather_data),
+        ('generate_html_content', generate_html_content, view),
+        ('generate_forecast_json', generate_forecast_json, view),
+        ('generate_short_message', generate_short_message, view),
+        ('format_weather_message', format_weather_message, view),
+    ]
+    timings = {}
+    for name, func, arg in stages:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func(arg)
+        timings[name] = (time.perf_counter() - started) * 1000 / loops
+    return timings
+
+def run_profile():
+    """性能分析模式：先分析一次完整运行（会真实更新页面并推送消息），再用同一份响应循环分析解析和渲染"""
+    print("性能分析模式会完整执行一次任务，包括写入页面和真实推送消息")
+    profile_call('main', main)
+    
+    # 完整运行刚写入页面地点的缓存（有效期为 0 时也会写入），渲染分析直接使用同一份响应
+    payload = load_cached_payload(get_weather_cache_key(LONGITUDE, LATITUDE), WEATHER_CACHE_MAX_STALE)
+    if payload is None:
+        print("缓存中没有页面地点的天气响应，单独请求一次用于渲染分析")
+        try:
+            payload = request_profile_payload('full', LONGITUDE, LATITUDE)
+        except WeatherFetchError as e:
+            print(f"{str(e)}，跳过渲染分析")
+            return
+    timings = profile_call('render', render_loop, payload, PROFILE_RENDER_LOOPS)
+    lines = [f"循环 {PROFILE_RENDER_LOOPS} 次的平均耗时（受 cProfile 影响，只用于相互比较）:"]
+    lines += [f"{name}: {ms:.3f}ms" for name, ms in timings.items()]
+    with open(os.path.join(PROFILE_DIR, "render_timings.txt"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
 if __name__ == "__main__":
-    main()
+    # 通过 --async 参数或 WEATHER_ASYNC=1 启用异步模式，--watch-alerts 或 RUN_MODE=alerts 启用预警监控，
+    # --nowcast 或 RUN_MODE=nowcast 启用短临降水监控，--profile 或 WEATHER_PROFILE=1 启用性能分析
+    # （会完整执行一次任务，真实写入页面并推送消息），--serve 或 RUN_MODE=serve 启动常驻 HTTP 服务
+    check_config()
+    run_mode = os.getenv("RUN_MODE", "")
+    if "--profile" in sys.argv or os.getenv("WEATHER_PROFILE") == "1":
+        run_profile()
+    elif "--serve" in sys.argv or run_mode == "serve":
+        serve()
+    elif "--watch-alerts" in sys.argv or run_mode == "alerts":
+        watch_alerts()
+    elif "--nowcast" in sys.argv or run_mode == "nowcast":
+        watch_nowcast()
+    elif "--async" in sys.argv or os.getenv("WEATHER_ASYNC") == "1":
+        asyncio.run(async_main())
+    else:
+        main()
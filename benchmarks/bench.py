@@ -0,0 +1,201 @@
+"""离线基准测试：用录制的彩云天气响应和本地替身服务测量解析、渲染和推送的耗时
+
+用法:
+    python benchmarks/bench.py                    # 运行并与 baseline.json 比较，有退化时返回 1
+    python benchmarks/bench.py --update-baseline  # 运行并把结果写为新的基线
+    python benchmarks/bench.py --filter render    # 只运行名称包含 render 的项目
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_server import load_fixture, start_stub_server
+
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+FIXTURES = ['weather_typical', 'weather_alerts', 'weather_long_hourly']
+PUSH_UIDS = 2000
+
+# 单项耗时低于这个差值（毫秒）时不算退化，避免微秒级项目的抖动误报
+NOISE_FLOOR_MS = 0.05
+# 疑似退化时重新测量的次数
+RECHECK_TIMES = 2
+
+
+def prepare_environment(server):
+    """导入 action 前设置环境变量：指向替身服务、关闭缓存和限速，输出写到临时目录"""
+    workdir = tempfile.mkdtemp(prefix="weather-bench-")
+    os.chdir(workdir)
+    os.environ.update({
+        'WXPUSHER_TOKEN': 'AT_bench',
+        'WXPUSHER_UID': 'UID_bench',
+        'WEATHER_API_KEY': 'bench',
+        'CAIYUN_API_ROOT': server.url,
+        'WXPUSHER_API': f"{server.url}/api/send/message",
+        'WEATHER_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'WEATHER_CACHE_TTL': '0',
+        'WXPUSHER_RATE_LIMIT': '0',
+        'METRICS_JSONL': os.path.join(workdir, 'metrics.jsonl'),
+    })
+    return workdir
+
+
+def measure(func, repeat, min_round=0.05):
+    """先校准每轮调用次数，再取多轮中每次调用的最短耗时（毫秒），最短值受系统干扰最小"""
+    func()
+    # 与 timeit 一样在计时期间关闭垃圾回收，避免回收时机不同带来的抖动
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure_rounds(func, repeat, min_round)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _measure_rounds(func, repeat, min_round):
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round or number >= 10000:
+            break
+        number *= 2
+
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        rounds.append((time.perf_counter() - started) / number)
+    return min(rounds) * 1000
+
+
+def build_benchmarks(action, server):
+    """返回 (名称, 函数) 列表"""
+    benchmarks = []
+    for name in FIXTURES:
+        raw = load_fixture(name)
+        snapshot = action.parse_weather_payload(json.loads(raw))
+        view = action.build_weather_view(snapshot)
+
+        benchmarks.append((f"parse.{name}", lambda raw=raw: action.parse_weather_payload(action.json_loads(raw))))
+        benchmarks.append((f"render.view.{name}", lambda s=snapshot: action.build_weather_view(s)))
+        benchmarks.append((f"render.html.{name}", lambda v=view: action.generate_html_content(v)))
+        benchmarks.append((f"render.json.{name}", lambda v=view: action.generate_forecast_json(v)))
+        benchmarks.append((f"render.short.{name}", lambda v=view: action.generate_short_message(v)))
+        benchmarks.append((f"render.detail.{name}", lambda v=view: action.format_weather_message(v)))
+
+        def fetch(raw=raw):
+            server.weather_body = raw
+            if action.get_weather() is None:
+                raise RuntimeError("替身服务返回的天气数据解析失败")
+        benchmarks.append((f"get_weather.{name}", fetch))
+
+    message = action.generate_short_message(action.build_weather_view(
+        action.parse_weather_payload(json.loads(load_fixture('weather_typical')))))
+    uids = [f"UID_{i:05d}" for i in range(PUSH_UIDS)]
+
+    def push():
+        if not action.push_to_wxpusher(message, uids):
+            raise RuntimeError("推送到替身服务失败")
+    benchmarks.append((f"push.uids_{PUSH_UIDS}", push))
+    return benchmarks
+
+
+def compare(results, baseline, tolerance):
+    """返回退化项目列表 (名称, 基线, 当前)"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current > previous * tolerance and current - previous > NOISE_FLOOR_MS:
+            regressions.append((name, previous, current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="天气推送离线基准测试")
+    parser.add_argument('--repeat', type=int, default=7, help="每个项目测量的轮数")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="超过基线的倍数即视为退化")
+    parser.add_argument('--filter', default="", help="只运行名称包含该字符串的项目")
+    parser.add_argument('--update-baseline', action='store_true', help="把本次结果写入 baseline.json")
+    parser.add_argument('--output', help="把本次结果写入指定的 JSON 文件")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    prepare_environment(server)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import action
+
+    benchmarks = {name: func for name, func in build_benchmarks(action, server) if args.filter in name}
+    results = {}
+    for name, func in benchmarks.items():
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            results[name] = round(measure(func, args.repeat), 4)
+        extra = f"  {PUSH_UIDS / results[name] * 1000:,.0f} uids/s" if name.startswith('push.') else ""
+        print(f"{name:<40} {results[name]:>10.4f} ms{extra}")
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    # 疑似退化的项目重新测量几次取最短值，排除偶发的系统干扰
+    if not args.update_baseline:
+        for _ in range(RECHECK_TIMES):
+            suspects = compare(results, baseline.get('results', {}), args.tolerance)
+            if not suspects:
+                break
+            for name, _, _ in suspects:
+                with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                    results[name] = min(results[name], round(measure(benchmarks[name], args.repeat), 4))
+    server.shutdown()
+
+    record = {
+        'meta': {'python': platform.python_version(), 'machine': platform.machine(), 'platform': platform.platform()},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        record['results'] = {**baseline.get('results', {}), **results}
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已更新: {BASELINE_PATH}")
+        return 0
+
+    if not baseline:
+        print("没有基线文件，使用 --update-baseline 生成")
+        return 0
+    if baseline.get('meta', {}).get('machine') != record['meta']['machine']:
+        print(f"注意: 基线来自 {baseline['meta'].get('machine')} 平台，比较结果仅供参考")
+
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} 个项目超过基线 {args.tolerance} 倍:")
+        for name, previous, current in regressions:
+            print(f"  {name}: {previous:.4f} ms -> {current:.4f} ms ({current / previous:.2f}x)")
+        return 1
+    print(f"\n全部 {len(results)} 个项目均未超过基线 {args.tolerance} 倍")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""短临降水提醒判断的离线回归检查：用构造的逐分钟降水序列检查 nowcast_changed 何时需要通知
+
+用法:
+    python benchmarks/check_nowcast.py    # 全部通过返回 0，有不符合预期的场景时返回 1
+"""
+import contextlib
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+SERVER_TIME = 1_700_000_000
+# 每次轮询间隔 5 分钟
+POLL = 300
+
+
+def series(start=None, stop=None, length=120, value=1.0):
+    """生成未来 length 分钟的降水序列：start 分钟开始下雨，stop 分钟停止，start 为 None 时无雨"""
+    precipitation = [0.0] * length
+    if start is not None:
+        for minute in range(start, length if stop is None else stop):
+            precipitation[minute] = value
+    return precipitation
+
+
+def build_cases(action):
+    """返回 (场景, 上一次预测, 本次预测, 是否应通知) 列表"""
+    def predict(poll, start=None, stop=None):
+        return action.build_nowcast_prediction(SERVER_TIME + poll * POLL, series(start, stop))
+
+    dry = predict(0)
+    return [
+        ("第一次运行且无雨", None, dry, False),
+        ("第一次运行预测到降雨", None, predict(0, 30, 70), True),
+        ("开始下雨：无雨变为 30 分钟后有雨", dry, predict(1, 30, 70), True),
+        ("即将下雨：开始时间随轮询前移但绝对时间不变", predict(0, 30, 70), predict(1, 25, 65), False),
+        ("即将下雨：开始时间推迟超过容差", predict(0, 30, 70), predict(1, 50, 90), True),
+        ("持续下雨：开始时间随轮询后移，停止时间不变", predict(0, 0, 60), predict(1, 0, 55), False),
+        ("持续下雨：开始时间后移超过容差，停止时间不变", predict(0, 0, 60), predict(5, 0, 35), False),
+        ("持续下雨且两小时内不停", predict(0, 0), predict(1, 0), False),
+        ("持续下雨：停止时间提前超过容差", predict(0, 0, 60), predict(1, 0, 30), True),
+        ("雨停了：正在下雨变为未来两小时无雨", predict(0, 0, 20), predict(1), True),
+        ("出现停止时间：雨不停变为 40 分钟后停止", predict(0, 0), predict(1, 0, 40), True),
+        ("停止时间消失：预计停止变为两小时内不停", predict(0, 0, 40), predict(1, 0), True),
+        ("开始下雨：即将下雨变为正在下雨，时间与预测一致", predict(0, 5, 60), predict(1, 0, 55), False),
+    ]
+
+
+def main():
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import action
+
+    failures = 0
+    for name, previous, current, expected in build_cases(action):
+        result = action.nowcast_changed(previous, current)
+        ok = result == expected
+        failures += not ok
+        print(f"{'通过' if ok else '失败'}  {name}: 预期 {'通知' if expected else '不通知'}，实际 {'通知' if result else '不通知'}")
+    if failures:
+        print(f"\n{failures} 个场景不符合预期")
+        return 1
+    print("\n全部场景符合预期")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""压力测试：生成大量虚拟订阅者和地点，在本地替身服务上跑完整的获取 → 渲染 → 推送流程
+
+用法:
+    python benchmarks/loadtest.py --subscribers 10000 --locations 300
+    python benchmarks/loadtest.py --weather-latency-ms 120 --weather-error-rate 0.05 --push-error-rate 0.02
+    python benchmarks/loadtest.py --trace-memory --output loadtest.json
+
+报告端到端吞吐量、各阶段 p50/p99 延迟、注入错误的数量和内存峰值。
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from stub_server import load_fixture, start_stub_server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="天气推送压力测试")
+    parser.add_argument('--subscribers', type=int, default=5000, help="虚拟订阅者数量")
+    parser.add_argument('--locations', type=int, default=200, help="虚拟地点数量")
+    parser.add_argument('--skew', type=float, default=1.1, help="订阅者在地点间分布的 Zipf 指数，越大越集中")
+    parser.add_argument('--fixture', default='weather_typical', help="替身服务返回的录制响应")
+    parser.add_argument('--weather-latency-ms', type=float, default=50, help="天气接口注入的延迟")
+    parser.add_argument('--push-latency-ms', type=float, default=30, help="推送接口注入的延迟")
+    parser.add_argument('--weather-error-rate', type=float, default=0.0, help="天气接口返回 503 的比例")
+    parser.add_argument('--push-error-rate', type=float, default=0.0, help="推送接口返回 503 的比例")
+    parser.add_argument('--fetch-workers', type=int, default=16, help="获取天气的并发数（WEATHER_MAX_WORKERS）")
+    parser.add_argument('--push-workers', type=int, default=8, help="同时推送的地点数")
+    parser.add_argument('--push-rate', type=float, default=0, help="所有推送共用的每秒请求上限，0 表示不限")
+    parser.add_argument('--retry-delay', type=float, default=0.05, help="重试退避的基础间隔（秒）")
+    parser.add_argument('--trace-memory', action='store_true', help="用 tracemalloc 统计 Python 内存峰值（会变慢）")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="把报告写入指定的 JSON 文件")
+    return parser.parse_args()
+
+
+def prepare_environment(server, args):
+    """导入 action 前设置环境变量，所有输出写到临时目录"""
+    workdir = tempfile.mkdtemp(prefix="weather-loadtest-")
+    os.chdir(workdir)
+    os.environ.update({
+        'WXPUSHER_TOKEN': 'AT_loadtest',
+        'WXPUSHER_UID': 'UID_loadtest',
+        'WEATHER_API_KEY': 'loadtest',
+        'CAIYUN_API_ROOT': server.url,
+        'WXPUSHER_API': f"{server.url}/api/send/message",
+        'WEATHER_CACHE_DIR': os.path.join(workdir, 'cache'),
+        'WEATHER_CACHE_TTL': '0',
+        'WEATHER_CACHE_MAX_ENTRIES': str(args.locations + 1),
+        'WEATHER_MAX_WORKERS': str(args.fetch_workers),
+        'HTTP_POOL_MAXSIZE': str(max(args.fetch_workers, args.push_workers * 4)),
+        'WEATHER_RETRY_BASE_DELAY': str(args.retry_delay),
+        'WEATHER_RETRY_MAX_DELAY': str(args.retry_delay * 8),
+        'WXPUSHER_RATE_LIMIT': str(args.push_rate),
+        'METRICS_JSONL': os.path.join(workdir, 'metrics.jsonl'),
+    })
+
+
+def synthetic_population(args):
+    """生成地点列表和 {地点: [uid]}，订阅者按 Zipf 分布集中在少数地点"""
+    rng = random.Random(args.seed)
+    locations = []
+    seen = set()
+    while len(locations) < args.locations:
+        location = (round(rng.uniform(73.5, 134.8), 4), round(rng.uniform(18.2, 53.5), 4))
+        if location not in seen:
+            seen.add(location)
+            locations.append(location)
+    weights = [1 / (rank + 1) ** args.skew for rank in range(len(locations))]
+    subscribers = {location: [] for location in locations}
+    for i, location in enumerate(rng.choices(locations, weights=weights, k=args.subscribers)):
+        subscribers[location].append(f"UID_{i:06d}")
+    return locations, subscribers
+
+
+def percentile(values, q):
+    """最近秩法取百分位"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """把 {阶段: [秒]} 汇总为毫秒统计"""
+    return {
+        stage: {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(max(values) * 1000, 3),
+            'total_s': round(sum(values), 3),
+        }
+        for stage, values in samples.items() if values
+    }
+
+
+def run(action, locations, subscribers, args):
+    """跑一轮完整流程，返回 (各阶段耗时样本, 各阶段墙钟时间, 推送结果统计)"""
+    samples = {'render.view': [], 'render.html': [], 'render.short': [], 'push.location': []}
+    walls = {}
+
+    started = time.perf_counter()
+    results, errors = action.get_weather_batch(locations, max_workers=args.fetch_workers)
+    walls['fetch'] = time.perf_counter() - started
+
+    rendered = {}
+    started = time.perf_counter()
+    for location, weather_data in results.items():
+        if not subscribers[location]:
+            continue
+        t0 = time.perf_counter()
+        view = action.build_weather_view(weather_data)
+        t1 = time.perf_counter()
+        action.generate_html_content(view)
+        t2 = time.perf_counter()
+        rendered[location] = action.generate_short_message(view)
+        t3 = time.perf_counter()
+        samples['render.view'].append(t1 - t0)
+        samples['render.html'].append(t2 - t1)
+        samples['render.short'].append(t3 - t2)
+    walls['render'] = time.perf_counter() - started
+
+    def push(location):
+        t0 = time.perf_counter()
+        ok = action.push_to_wxpusher(rendered[location], subscribers[location])
+        return time.perf_counter() - t0, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.push_workers) as executor:
+        outcomes = list(executor.map(push, rendered))
+    walls['push'] = time.perf_counter() - started
+    samples['push.location'] = [elapsed for elapsed, _ in outcomes]
+
+    # 单次请求、解析和推送批次的耗时取自 action 自己记录的运行指标
+    for span in action.RUN_METRICS.spans:
+        if span['name'] in ('fetch.request', 'parse', 'push.batch'):
+            samples.setdefault(span['name'], []).append(span['seconds'])
+
+    push_stats = {
+        'locations_fetched': len(results),
+        'locations_failed': len(errors),
+        'locations_pushed': sum(1 for _, ok in outcomes if ok),
+        'locations_push_failed': sum(1 for _, ok in outcomes if not ok),
+        'subscribers_reached': sum(len(subscribers[location]) for location, (_, ok) in zip(rendered, outcomes) if ok),
+    }
+    return samples, walls, push_stats
+
+
+def main():
+    args = parse_args()
+    server = start_stub_server(seed=args.seed)
+    server.weather_body = load_fixture(args.fixture)
+    server.weather_latency = args.weather_latency_ms / 1000
+    server.push_latency = args.push_latency_ms / 1000
+    server.weather_error_rate = args.weather_error_rate
+    server.push_error_rate = args.push_error_rate
+    prepare_environment(server, args)
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        import action
+
+    locations, subscribers = synthetic_population(args)
+    print(f"订阅者 {args.subscribers}，地点 {args.locations}，"
+          f"最集中的地点有 {max(len(uids) for uids in subscribers.values())} 人，"
+          f"无人订阅的地点 {sum(1 for uids in subscribers.values() if not uids)} 个")
+
+    if args.trace_memory:
+        tracemalloc.start()
+    action.RUN_METRICS.reset()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        samples, walls, push_stats = run(action, locations, subscribers, args)
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    if args.trace_memory:
+        tracemalloc.stop()
+    server.shutdown()
+
+    report = {
+        'config': vars(args),
+        'elapsed_s': round(elapsed, 3),
+        'throughput': {
+            'subscribers_per_s': round(push_stats['subscribers_reached'] / elapsed, 1),
+            'locations_per_s': round(push_stats['locations_fetched'] / elapsed, 1),
+        },
+        'wall_s': {stage: round(seconds, 3) for stage, seconds in walls.items()},
+        'stages': summarize(samples),
+        'results': push_stats,
+        'counters': dict(action.RUN_METRICS.counters),
+        'upstream': dict(server.counts),
+        'memory': {
+            'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'traced_peak_kib': round(traced_peak / 1024, 1) if traced_peak is not None else None,
+        },
+    }
+
+    print(f"总耗时 {report['elapsed_s']}s（获取 {report['wall_s']['fetch']}s，"
+          f"渲染 {report['wall_s']['render']}s，推送 {report['wall_s']['push']}s）")
+    print(f"吞吐量: {report['throughput']['subscribers_per_s']} 订阅者/s，{report['throughput']['locations_per_s']} 地点/s")
+    print(f"{'阶段':<16}{'次数':>8}{'p50 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    for stage, stats in report['stages'].items():
+        print(f"{stage:<18}{stats['count']:>8}{stats['p50_ms']:>12.3f}{stats['p99_ms']:>12.3f}{stats['max_ms']:>12.3f}")
+    print(f"结果: {json.dumps(push_stats, ensure_ascii=False)}")
+    print(f"上游请求: {json.dumps(report['upstream'])}，重试计数: {json.dumps(report['counters'])}")
+    memory = f"进程 RSS 峰值 {report['memory']['max_rss_kib'] / 1024:.1f} MiB"
+    if traced_peak is not None:
+        memory += f"，Python 分配峰值 {report['memory']['traced_peak_kib'] / 1024:.1f} MiB"
+    print(memory)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0 if push_stats['locations_failed'] == 0 and push_stats['locations_push_failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
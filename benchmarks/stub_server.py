@@ -0,0 +1,108 @@
+"""彩云天气和 WxPusher 的本地替身服务，供基准测试离线使用"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    """读取录制的彩云天气响应，返回原始字节"""
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), 'rb') as f:
+        return f.read()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """GET 返回当前设置的天气响应，POST 按 WxPusher 的格式返回每个用户送达成功，可注入延迟和 503 错误"""
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，不关闭 Nagle 时小响应会多等一个延迟确认
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = self.server.weather_body
+        self.server.record('weather')
+        if self._inject(self.server.weather_latency, self.server.weather_error_rate):
+            return
+        self._reply(200, body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        self.server.record('push', len(request.get('uids', [])))
+        if self._inject(self.server.push_latency, self.server.push_error_rate):
+            return
+        data = [{'uid': uid, 'code': 1000, 'status': '创建发送任务成功'} for uid in request.get('uids', [])]
+        self._reply(200, json.dumps({'code': 1000, 'msg': '处理成功', 'data': data, 'success': True}).encode('utf-8'))
+
+    def _inject(self, latency, error_rate):
+        """按配置等待，并按错误率返回 503；返回是否已经回复了错误"""
+        if latency:
+            time.sleep(latency)
+        if error_rate and self.server.random() < error_rate:
+            self.server.record('errors')
+            self._reply(503, b'{"status":"failed","error":"injected"}')
+            return True
+        return False
+
+    def _reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address=('127.0.0.1', 0), seed=None):
+        super().__init__(address, StubHandler)
+        self.weather_body = load_fixture('weather_typical')
+        # 注入的延迟（秒）和错误率（0~1）
+        self.weather_latency = 0.0
+        self.push_latency = 0.0
+        self.weather_error_rate = 0.0
+        self.push_error_rate = 0.0
+        self.counts = {'weather': 0, 'push': 0, 'push_uids': 0, 'errors': 0}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def record(self, kind, uids=0):
+        with self._lock:
+            self.counts[kind] += 1
+            if kind == 'push':
+                self.counts['push_uids'] += uids
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub_server(seed=None):
+    """在后台线程启动替身服务，返回服务对象"""
+    server = StubServer(seed=seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_stub_server()
+    print(f"替身服务已启动: {server.url}")
+    print(f"CAIYUN_API_ROOT={server.url} WXPUSHER_API={server.url}/api/send/message")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()